@@ -3,22 +3,42 @@ import os
 import re
 import io
 import time
-import qrcode
 import asyncio
 import threading
+import multiprocessing
 import tempfile
 import shutil
+import hashlib
+import socket
+import itertools
+import collections
+import contextlib
 from datetime import datetime, timedelta, timezone
-from typing import Optional, Tuple, Dict, Any, List
+from typing import Optional, Tuple, Dict, Any, List, Iterable, Callable, Awaitable, AsyncIterator, Union
 
-from flask import Flask
+# uvloop (tez event loop) optional; policy Client banne se pehle set honi chahiye
+# kyunki pyrogram Client __init__ me hi event loop le leta hai
+if os.environ.get("USE_UVLOOP", "1") == "1":
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
 
-from pyrogram import Client, filters
+from pyrogram import Client, filters, idle, raw, utils, types
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Session, Auth
+from pyrogram.storage import Storage, MemoryStorage
+from pyrogram.storage.sqlite_storage import get_input_peer
 from pyrogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     Message,
     CallbackQuery,
+    InputMediaPhoto,
+    InputMediaVideo,
+    InputMediaDocument,
+    InputMediaAudio,
 )
 from pyrogram.errors import (
     PhoneNumberInvalid,
@@ -33,6 +53,7 @@ from pyrogram.errors import (
     ChatWriteForbidden,
     ChatIdInvalid,
     PeerIdInvalid,
+    FilePartMissing,
 )
 
 # QrCodeExpired kuch versions me nahi hota, isliye safe import:
@@ -44,6 +65,8 @@ except ImportError:
         pass
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
 # ---------- ENVIRONMENT ----------
 API_ID = int(os.environ["API_ID"])
@@ -60,12 +83,128 @@ OWNER_IDS = {1598576202, 6518065496}
 
 MAX_BATCH_LIMIT = 1000       # premium/owner
 FREE_BATCH_LIMIT = 50        # free users
-SLEEP_SECONDS = 12
+# Flood-aware pacer (token bucket) – fixed sleep ki jagah
+PACER_SESSION_RATE = 1.0          # user/bot session ka start rate (msgs/sec)
+PACER_SESSION_MAX_RATE = 10.0
+PACER_CHAT_RATE = 0.5             # destination chat ka start rate
+PACER_PRIVATE_CHAT_MAX_RATE = 1.0 # Telegram: ~1 msg/sec per private chat
+PACER_GROUP_CHAT_MAX_RATE = 20 / 60  # Telegram: ~20 msgs/min per group/channel
+PACER_MIN_RATE = 0.05
+PACER_BURST = 3
+PACER_SPEEDUP = 1.05              # har successful send pe rate itna badhta hai
+HEADER_UPDATE_INTERVAL = 5        # pinned header edit ka min gap (seconds)
+SEND_FLOOD_RETRIES = 3            # bada FloodWait -> pacer wait karke itni baar dobara send
+
+# Batch pipeline: fetcher -> N downloaders -> M uploaders
+PIPELINE_DOWNLOADERS = int(os.environ.get("PIPELINE_DOWNLOADERS", 2))
+PIPELINE_UPLOADERS = int(os.environ.get("PIPELINE_UPLOADERS", 1))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 4))
+# Lookahead: send position se itne items aage tak download, aur itne bytes tak hold
+PREFETCH_DEPTH = max(
+    1, int(os.environ.get("PREFETCH_DEPTH", PIPELINE_DOWNLOADERS + PIPELINE_QUEUE_SIZE))
+)
+PREFETCH_BYTE_BUDGET = int(os.environ.get("PREFETCH_BYTE_BUDGET", 512 * 1024 * 1024))
+
+# file_unique_id -> bot file_id cache (dobara bhejne pe zero transfer)
+FILE_CACHE_TTL = 30 * 24 * 3600       # itne din use na ho to Mongo TTL index hata deta hai
+FILE_CACHE_MAX_ENTRIES = 50000        # isse zyada pe sabse purane (LRU) hatao
+
+ALBUM_MAX_SIZE = 10                   # Telegram media group me max 10 items
+
+LINK_LIST_MAX_BYTES = 1024 * 1024    # uploaded links .txt ki max size
+
+# Count step pe number ki jagah: start link -> chat ka latest message (purane se naya / ulta)
+BATCH_SPAN_MODES = {"latest": "latest", "all": "latest", "reverse": "reverse", "latest-rev": "reverse"}
+
+# Resumable batches
+CHECKPOINT_EVERY = 5                  # itne source messages ke baad history me checkpoint
+AUTO_RESUME_BATCHES = os.environ.get("AUTO_RESUME_BATCHES", "0") == "1"
+
+# Global scheduler: kitne batches ek saath, per-user queue, transfer caps
+MAX_ACTIVE_BATCHES = int(os.environ.get("MAX_ACTIVE_BATCHES", 4))
+MAX_QUEUED_BATCHES_PER_USER = int(os.environ.get("MAX_QUEUED_BATCHES_PER_USER", 3))
+GLOBAL_MAX_DOWNLOADS = int(os.environ.get("GLOBAL_MAX_DOWNLOADS", 6))
+GLOBAL_MAX_UPLOADS = int(os.environ.get("GLOBAL_MAX_UPLOADS", 6))
+
+# Adhure dialogs/logins kitni der ek hi step pe atke rahen (seconds), phir janitor hata de
+LOGIN_STATE_TTL = int(os.environ.get("LOGIN_STATE_TTL", 10 * 60))
+BATCH_STATE_TTL = int(os.environ.get("BATCH_STATE_TTL", 30 * 60))
+SETTINGS_STATE_TTL = int(os.environ.get("SETTINGS_STATE_TTL", 10 * 60))
+STATE_JANITOR_INTERVAL = 60
+
+# Job queue: "local" (in-process) ya "mongo" (jobs collection + leases, kai replicas)
+JOB_QUEUE = os.environ.get("JOB_QUEUE", "local").lower()
+JOB_LEASE_TTL = int(os.environ.get("JOB_LEASE_TTL", 60))      # heartbeat na aaye to itne sec baad job free
+JOB_HEARTBEAT_INTERVAL = max(1, JOB_LEASE_TTL // 4)
+JOB_POLL_INTERVAL = int(os.environ.get("JOB_POLL_INTERVAL", 5)) # doosre replicas ke naye jobs kitni der me dikhen
+REPLICA_ID = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+
+# Batches alag worker processes me (user_id % N shard); 0 = sab isi process me
+BATCH_WORKER_PROCESSES = int(os.environ.get("BATCH_WORKER_PROCESSES", 0))
+SHARD_CANCEL_TIMEOUT = 15             # cancel ke baad shard ke 'done' ka itna wait (seconds)
+SHARD_REPORT_INTERVAL = 30            # shards itne seconds me apne stats front ko bhejte hain
+
+# Pyrogram session + peers Mongo me (restart ke baad peer resolution bina network)
+PERSISTENT_SESSIONS = os.environ.get("PERSISTENT_SESSIONS", "1") == "1"
+
+# Long-lived user-session clients (batch start pe dobara connect nahi)
+USER_CLIENT_POOL_SIZE = int(os.environ.get("USER_CLIENT_POOL_SIZE", 20))
+USER_CLIENT_IDLE_TIMEOUT = int(os.environ.get("USER_CLIENT_IDLE_TIMEOUT", 15 * 60))
+
+# Bade media ke liye parallel upload.getFile (kai media connections, alag offsets)
+PARALLEL_DOWNLOAD_MIN_SIZE = int(os.environ.get("PARALLEL_DOWNLOAD_MIN_SIZE", 20 * 1024 * 1024))
+PARALLEL_DOWNLOAD_CONNECTIONS = int(os.environ.get("PARALLEL_DOWNLOAD_CONNECTIONS", 4))  # per session per DC
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024     # upload.getFile ka max limit (1 MB)
+
+# Bade re-uploads ke liye parallel saveBigFilePart
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024 # isse bade files "big" parts (saveBigFilePart) se jaate hain
+PARALLEL_UPLOAD_MIN_SIZE = max(
+    int(os.environ.get("PARALLEL_UPLOAD_MIN_SIZE", 20 * 1024 * 1024)), BIG_FILE_THRESHOLD + 1
+)
+PARALLEL_UPLOAD_CONNECTIONS = int(os.environ.get("PARALLEL_UPLOAD_CONNECTIONS", 4))
+PARALLEL_UPLOAD_WINDOW = int(os.environ.get("PARALLEL_UPLOAD_WINDOW", 8))  # ek file ke in-flight parts
+UPLOAD_PART_SIZE = 512 * 1024         # saveBigFilePart ka max part size
+UPLOAD_PART_RETRIES = 3               # ek part itni baar retry, phir poora upload fail
+
+# Streaming relay: source stream_media -> ring buffer -> bot upload parts (disk nahi)
+STREAM_RELAY = os.environ.get("STREAM_RELAY", "1") == "1"
+RELAY_BUFFER_PARTS = int(os.environ.get("RELAY_BUFFER_PARTS", 16))  # ring me max 512 KB parts
+
+# Extra helper bots: uploads unke token/connections pe, dump chat se primary bot copy karta hai
+UPLOADER_BOT_TOKENS = [t.strip() for t in os.environ.get("UPLOADER_BOT_TOKENS", "").split(",") if t.strip()]
+UPLOAD_DUMP_CHAT_ID = int(os.environ.get("UPLOAD_DUMP_CHAT_ID", 0))  # sab helpers + primary bot admin hon
+
+# Chhote media RAM (BytesIO) me, disk round trip ke bina
+IN_MEMORY_MAX_SIZE = int(os.environ.get("IN_MEMORY_MAX_SIZE", 5 * 1024 * 1024))
+IN_MEMORY_POOL_BYTES = max(
+    int(os.environ.get("IN_MEMORY_POOL_BYTES", 64 * 1024 * 1024)), IN_MEMORY_MAX_SIZE
+)
+IN_MEMORY_POOL_BUFFERS = 8            # itne khali buffers reuse ke liye rakhe jaate hain
+
+# Temp storage: disk vs tmpfs, byte quotas, orphan sweep
+TEMP_ROOT = os.environ.get("TEMP_ROOT") or tempfile.gettempdir()
+TMPFS_DIR = os.environ.get("TMPFS_DIR", "/dev/shm")
+TMPFS_MAX_FILE_SIZE = int(os.environ.get("TMPFS_MAX_FILE_SIZE", 50 * 1024 * 1024))  # isse bade disk pe
+TMPFS_MIN_FREE = 64 * 1024 * 1024     # tmpfs me itni jagah hamesha khali chhodo
+TEMP_USER_QUOTA = int(os.environ.get("TEMP_USER_QUOTA", 2 * 1024 ** 3))
+TEMP_GLOBAL_QUOTA = int(os.environ.get("TEMP_GLOBAL_QUOTA", 8 * 1024 ** 3))
+
+FETCH_CHUNK_SIZE = 200       # MTProto getMessages ek call me max 200 ids leta hai
+PREFETCH_MAX_CHUNKS = 2      # itne fetched chunks buffer me ready rehte hain
+PEER_CACHE_TTL = 30 * 60     # resolved source chat kitni der yaad rahe (seconds)
+HISTORY_SCAN_EMPTY_RATIO = 0.5  # pehle chunk me itne empty ids -> history iterator mode
+HISTORY_CHUNK_SIZE = 100     # messages.getHistory ek call me max 100
+HISTORY_CHUNK_RETRIES = 4    # history chunk fail (FloodWait/network) -> backoff ke saath itni baar retry
 
 # ---------- MONGO ----------
 mongo_client = AsyncIOMotorClient(MONGO_URI)
 db = mongo_client["serena_bot"]
 users_coll = db["users"]
+file_cache_coll = db["file_cache"]
+pyro_sessions_coll = db["pyro_sessions"]   # pyrogram session (auth key, dc, user) per client name
+pyro_peers_coll = db["pyro_peers"]         # pyrogram peer cache (id, access_hash, username) per client name
+jobs_coll = db["jobs"]                     # JOB_QUEUE=mongo: batch jobs (queued/running + lease)
+job_locks_coll = db["job_locks"]           # JOB_QUEUE=mongo: user_id -> single-flight lock (lease ke saath)
 
 # ---------- GLOBAL STATES ----------
 pending_logins: Dict[int, Dict[str, Any]] = {}   # phone+otp login temp
@@ -73,17 +212,212 @@ login_steps: Dict[int, str] = {}                 # 'session_wait' / 'phone_wait_
 login_qr_tasks: Dict[int, asyncio.Task] = {}     # QR login tasks
 
 batch_states: Dict[int, Dict[str, Any]] = {}     # 'step', 'link', 'task_id', 'is_private', 'use_user_session', 'dest_chat_id'
-batch_tasks: Dict[int, asyncio.Task] = {}
+batch_tasks: Dict[int, asyncio.Task] = {}             # user_id -> abhi chal raha batch (scheduler manage karta hai)
+shutting_down = False                            # True -> cancel hue batches 'interrupted' mark hote hain
+handed_off_batches: set = set()                  # (user_id, task_id) jinka lease doosre replica ne le liya
 
 settings_states: Dict[int, str] = {}             # 'await_chat_id', 'await_remove_words'
 
+peer_resolution_cache: Dict[Tuple[str, Any], Dict[str, Any]] = {}  # (session, chat) -> 'candidate', 'peer', 'chat_id', 'expires'
+
+# ---------- PERSISTENT PYROGRAM STORAGE (Mongo) ----------
+class MongoStorage(Storage):
+    """
+    Pyrogram Storage jo session (dc, auth key, user) aur peers Mongo me rakhta hai,
+    taaki restart ke baad access hashes ke liye get_dialogs/warm-up na karna pade.
+    Reads in-memory cache se (miss pe Mongo), writes turant Mongo me.
+    session_string mila ho aur stored session alag ho to usi se dobara seed hota
+    hai (doosra account ho to purane peers hata diye jaate hain); bot token badle
+    to purana session hata ke fresh sign-in.
+    """
+
+    USERNAME_TTL = 8 * 60 * 60
+    FIELDS = ("dc_id", "api_id", "test_mode", "auth_key", "date", "user_id", "is_bot")
+
+    def __init__(self, name: str, session_string: Optional[str] = None, bot_token: Optional[str] = None):
+        super().__init__(name)
+        self.session_string = session_string
+        self.bot_token = bot_token
+        self.fields: Dict[str, Any] = {}
+        self.peers: Dict[int, Tuple[int, int, str, Optional[str], Optional[str], float]] = {}
+        self.usernames: Dict[str, int] = {}
+        self.dropped = False  # delete() ke baad chalta client Mongo me dobara na likhe
+
+    async def open(self):
+        doc = await pyro_sessions_coll.find_one({"_id": self.name}) or {}
+        fingerprint = hash_session_string(self.session_string or self.bot_token)
+        if fingerprint and doc.get("fingerprint") != fingerprint:
+            seeded = await self._seed_from_session_string() if self.session_string else {}
+            if doc and doc.get("user_id") != seeded.get("user_id"):
+                await pyro_peers_coll.delete_many({"session": self.name})
+            doc = {**seeded, "fingerprint": fingerprint}
+            await pyro_sessions_coll.replace_one({"_id": self.name}, doc, upsert=True)
+        self.fields = {k: doc.get(k) for k in self.FIELDS}
+        if self.fields["auth_key"] is not None:
+            self.fields["auth_key"] = bytes(self.fields["auth_key"])
+        if not doc:
+            await pyro_sessions_coll.insert_one({"_id": self.name, **self.fields})
+
+    async def _seed_from_session_string(self) -> Dict[str, Any]:
+        # Session string ka format pyrogram ka MemoryStorage hi parse kare
+        memory = MemoryStorage(self.name, self.session_string)
+        await memory.open()
+        try:
+            return {
+                "dc_id": await memory.dc_id(),
+                "api_id": await memory.api_id(),
+                "test_mode": await memory.test_mode(),
+                "auth_key": await memory.auth_key(),
+                "date": 0,
+                "user_id": await memory.user_id(),
+                "is_bot": await memory.is_bot(),
+            }
+        finally:
+            await memory.close()
+
+    async def save(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def delete(self):
+        self.dropped = True
+        await pyro_sessions_coll.delete_one({"_id": self.name})
+        await pyro_peers_coll.delete_many({"session": self.name})
+
+    def _cache_peer(self, peer_id, access_hash, peer_type, username, phone_number, updated):
+        self.peers[peer_id] = (peer_id, access_hash, peer_type, username, phone_number, updated)
+        if username:
+            self.usernames[username.lower()] = peer_id
+
+    async def update_peers(self, peers: List[Tuple[int, int, str, str, str]]):
+        now = time.time()
+        ops = []
+        for peer_id, access_hash, peer_type, username, phone_number in peers:
+            cached = self.peers.get(peer_id)
+            unchanged = cached and cached[1:5] == (access_hash, peer_type, username, phone_number)
+            if unchanged and now - cached[5] < self.USERNAME_TTL / 2:
+                # Same peer baar baar aata hai, har baar Mongo write nahi. Cache ka time
+                # last persisted 'updated' hi rehta hai, warna Mongo wala kabhi refresh na ho
+                continue
+            self._cache_peer(peer_id, access_hash, peer_type, username, phone_number, now)
+            ops.append(
+                UpdateOne(
+                    {"_id": f"{self.name}:{peer_id}"},
+                    {"$set": {
+                        "session": self.name,
+                        "id": peer_id,
+                        "access_hash": access_hash,
+                        "type": peer_type,
+                        "username": username.lower() if username else None,
+                        "phone_number": phone_number,
+                        "updated": now,
+                    }},
+                    upsert=True,
+                )
+            )
+        if ops and not self.dropped:
+            await pyro_peers_coll.bulk_write(ops, ordered=False)
+
+    async def _load_peer(self, query: Dict[str, Any]) -> Optional[Tuple]:
+        doc = await pyro_peers_coll.find_one(
+            {"session": self.name, **query}, sort=[("updated", -1)]
+        )
+        if not doc:
+            return None
+        self._cache_peer(
+            doc["id"], doc["access_hash"], doc["type"],
+            doc.get("username"), doc.get("phone_number"), doc.get("updated", 0),
+        )
+        return self.peers[doc["id"]]
+
+    async def get_peer_by_id(self, peer_id: int):
+        peer = self.peers.get(peer_id) or await self._load_peer({"id": peer_id})
+        if peer is None:
+            raise KeyError(f"ID not found: {peer_id}")
+        return get_input_peer(*peer[:3])
+
+    async def get_peer_by_username(self, username: str):
+        username = username.lower()
+        peer_id = self.usernames.get(username)
+        peer = self.peers.get(peer_id) if peer_id else await self._load_peer({"username": username})
+        if peer is None:
+            raise KeyError(f"Username not found: {username}")
+        if abs(time.time() - peer[5]) > self.USERNAME_TTL:
+            raise KeyError(f"Username expired: {username}")
+        return get_input_peer(*peer[:3])
+
+    async def get_peer_by_phone_number(self, phone_number: str):
+        peer = next((p for p in self.peers.values() if p[4] == phone_number), None)
+        peer = peer or await self._load_peer({"phone_number": phone_number})
+        if peer is None:
+            raise KeyError(f"Phone number not found: {phone_number}")
+        return get_input_peer(*peer[:3])
+
+    async def _accessor(self, field: str, value: Any):
+        if value is object:
+            return self.fields.get(field)
+        self.fields[field] = value
+        if not self.dropped:
+            await pyro_sessions_coll.update_one(
+                {"_id": self.name}, {"$set": {field: value}}, upsert=True
+            )
+
+    async def dc_id(self, value: int = object):
+        return await self._accessor("dc_id", value)
+
+    async def api_id(self, value: int = object):
+        return await self._accessor("api_id", value)
+
+    async def test_mode(self, value: bool = object):
+        return await self._accessor("test_mode", value)
+
+    async def auth_key(self, value: bytes = object):
+        return await self._accessor("auth_key", value)
+
+    async def date(self, value: int = object):
+        return await self._accessor("date", value)
+
+    async def user_id(self, value: int = object):
+        return await self._accessor("user_id", value)
+
+    async def is_bot(self, value: bool = object):
+        return await self._accessor("is_bot", value)
+
+
+def hash_session_string(session_string: Optional[str]) -> Optional[str]:
+    if not session_string:
+        return None
+    return hashlib.sha256(session_string.encode()).hexdigest()
+
+
+def use_persistent_storage(client: Client) -> Client:
+    """in_memory Client ka storage Mongo wale se badlo (PERSISTENT_SESSIONS off ho to jaisa hai)."""
+    if PERSISTENT_SESSIONS:
+        client.storage = MongoStorage(
+            client.name,
+            session_string=getattr(client, "session_string", None),
+            bot_token=getattr(client, "bot_token", None),
+        )
+    return client
+
+
+async def ensure_pyro_storage_indexes():
+    await pyro_peers_coll.create_index([("session", 1), ("id", 1)])
+    await pyro_peers_coll.create_index([("session", 1), ("username", 1)])
+    await pyro_peers_coll.create_index([("session", 1), ("phone_number", 1)])
+
+
 # ---------- BOT ----------
-bot = Client(
-    "serena_main_bot",
-    api_id=API_ID,
-    api_hash=API_HASH,
-    bot_token=BOT_TOKEN,
-    in_memory=True,
+bot = use_persistent_storage(
+    Client(
+        "serena_main_bot",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+        in_memory=True,
+    )
 )
 
 
@@ -169,6 +503,86 @@ def parse_telegram_link(link: str) -> Tuple[Any, int]:
     raise ValueError("Invalid Telegram message link")
 
 
+BatchSegment = Tuple[Any, int, int]  # (chat, first_msg_id, last_msg_id)
+
+
+def parse_batch_spec(text: str) -> List[BatchSegment]:
+    """
+    Multi-link job spec: newline/space/comma se alag links. Har link ek message
+    ya `.../START-END` id range ho sakta hai; '#' se shuru lines comment.
+    - https://t.me/channel/10            => ("channel", 10, 10)
+    - https://t.me/c/123456789/10-25     => (-100123456789, 10, 25)
+    """
+    segments: List[BatchSegment] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        for token in re.split(r"[\s,]+", line):
+            if not token:
+                continue
+            range_match = re.match(r"^(.*/)(\d+)-(\d+)$", token)
+            if range_match:
+                chat, first = parse_telegram_link(range_match.group(1) + range_match.group(2))
+                last = int(range_match.group(3))
+                if last < first:
+                    first, last = last, first
+            else:
+                chat, first = parse_telegram_link(token)
+                last = first
+            segments.append((chat, first, last))
+    if not segments:
+        raise ValueError("Koi valid Telegram link nahi mila")
+    return segments
+
+
+def is_multi_batch_spec(text: str) -> bool:
+    """Ek se zyada link ya koi range -> multi job (count step nahi hota)."""
+    try:
+        segments = parse_batch_spec(text)
+    except ValueError:
+        return False
+    return len(segments) > 1 or segments[0][1] != segments[0][2]
+
+
+def batch_spec_count(segments: List[BatchSegment]) -> int:
+    return sum(last - first + 1 for _, first, last in segments)
+
+
+def truncate_batch_spec(segments: List[BatchSegment], limit: int) -> List[BatchSegment]:
+    """Segments ko itna kaato ki total messages `limit` se zyada na ho."""
+    result: List[BatchSegment] = []
+    left = limit
+    for chat, first, last in segments:
+        if left <= 0:
+            break
+        last = min(last, first + left - 1)
+        result.append((chat, first, last))
+        left -= last - first + 1
+    return result
+
+
+def format_batch_spec(segments: List[BatchSegment]) -> str:
+    """Canonical spec text (history me yahi 'link' save hota hai, resume pe parse)."""
+    lines = []
+    for chat, first, last in segments:
+        if isinstance(chat, int):
+            base = f"https://t.me/c/{str(chat)[4:]}"
+        else:
+            base = f"https://t.me/{chat}"
+        lines.append(f"{base}/{first}" if first == last else f"{base}/{first}-{last}")
+    return "\n".join(lines)
+
+
+def batch_job_label(link: str) -> str:
+    """Header/plan ke liye chhota naam: single link wahi, multi job -> summary."""
+    if not is_multi_batch_spec(link):
+        return link
+    segments = parse_batch_spec(link)
+    chats = {chat for chat, _, _ in segments}
+    return f"{len(segments)} links/ranges from {len(chats)} chat(s) – {segments[0][0]}…"
+
+
 def replace_serena_text(text: Optional[str], enabled: bool) -> Optional[str]:
     if not text or not enabled:
         return text
@@ -382,10 +796,11 @@ async def cmd_help(client: Client, msg: Message):
         "• /login – DM me login menu (Session / Phone+OTP / QR Code)\n"
         "• /logout – Session logout (DM only)\n"
         "• /batch – Channel/chat link se batch me messages & media nikaalo\n"
+        "• /resume – Restart/crash se ruka batch wahi se continue karo\n"
         "• /status – Login, premium aur current status ❤️\n"
         "• /plan – History, stats, premium remaining time\n"
         "• /settings – DM me Set Chat ID, 'Serena' → 'Kumari', Remove Words (premium)\n"
-        "• /cancel – Ongoing task cancel (login/batch etc.)\n"
+        "• /cancel – Ongoing task cancel (login/batch + queued batches)\n"
         "• /clear – (Owner only) Mongo DB user data clear kare\n\n"
         "Login Methods (DM only):\n"
         "1) Session String – Pyrogram/Telethon session paste\n"
@@ -428,7 +843,13 @@ async def cmd_status(client: Client, msg: Message):
 
     set_chat = doc.get("set_chat_id")
     replace_flag = bool(doc.get("replace_serena", False))
-    running_batch = user_id in batch_tasks
+    running_batch = await batch_scheduler.is_running(user_id)
+    queued_batches = await batch_scheduler.queued_count(user_id)
+    # Shards on hon to batch (aur uski temp files) shard process me hai -> uski report se
+    if worker_shards.enabled:
+        temp_used = worker_shards.user_temp_usage(user_id)
+    else:
+        temp_used = temp_storage.user_usage(user_id)
 
     text = (
         "💖 SERENA – Your Current Status 💖\n\n"
@@ -437,8 +858,23 @@ async def cmd_status(client: Client, msg: Message):
         f"💎 Premium: {prem_text}\n"
         f"📡 Set Chat ID: {set_chat}\n"
         f"✏️ Replace 'Serena' → 'Kumari': {'✅ ON' if replace_flag else '❌ OFF'}\n"
-        f"📦 Batch running: {'🔥 YES' if running_batch else '❄️ NO'}"
+        f"📦 Batch running: {'🔥 YES' if running_batch else '❄️ NO'}\n"
+        f"⏳ Batches in queue: {queued_batches}\n"
+        f"💾 Temp storage in use: {humanbytes(temp_used)}"
     )
+    if is_owner(user_id):
+        if worker_shards.enabled:
+            # Transfers, pools, temp storage shards me hain -> unki report, front ki nahi
+            text += f"\n\n🧩 {worker_shards.summary()}\n{worker_shards.report()}"
+        else:
+            text += f"\n\n🗃 {file_cache_summary()}"
+            text += f"\n📶 {transfer_timings_summary()}"
+            text += f"\n🧠 {memory_pool.summary()}"
+            text += f"\n💾 {temp_storage.summary()}"
+            text += f"\n🔌 {user_client_pool.summary()}"
+            text += f"\n📤 {uploader_pool.summary()}"
+        text += f"\n🗂 {batch_scheduler.summary()}"
+        text += f"\n🧹 {state_janitor.summary()}"
     await msg.reply_text(text)
     await log_to_channel(f"/status by {user_id} in {msg.chat.id}")
 
@@ -513,7 +949,7 @@ async def cmd_plan(client: Client, msg: Message):
             if isinstance(start_time, datetime)
             else "N/A"
         )
-        link = h.get("link", "")
+        link = batch_job_label(h.get("link", ""))
         short_link = link if len(link) <= 60 else link[:57] + "..."
 
         lines.append(
@@ -521,10 +957,13 @@ async def cmd_plan(client: Client, msg: Message):
             f"   Link: {short_link}"
         )
 
-    active_state = batch_states.get(user_id)
+    active_job = await batch_scheduler.active_job(user_id)
     active_info = "No"
-    if user_id in batch_tasks and active_state and active_state.get("step") == "running":
-        active_info = f"Yes (link: {active_state.get('link')})"
+    if active_job:
+        active_info = f"Yes (link: {batch_job_label(active_job.get('link', ''))})"
+    queued_batches = await batch_scheduler.queued_count(user_id)
+    if queued_batches:
+        active_info += f" | {queued_batches} queued"
 
     text = "🌙 SERENA – Tumhara Love Plan & History 🌙\n\n"
     text += f"👤 User: {user_id}"
@@ -582,9 +1021,7 @@ async def cmd_cancel(client: Client, msg: Message):
         settings_states.pop(user_id, None)
         cancelled_any = True
 
-    task = batch_tasks.pop(user_id, None)
-    if task and not task.done():
-        task.cancel()
+    if await batch_scheduler.cancel_user(user_id):
         cancelled_any = True
 
     batch_states.pop(user_id, None)
@@ -614,13 +1051,13 @@ async def cmd_logout(client: Client, msg: Message):
     if qr_task and not qr_task.done():
         qr_task.cancel()
 
-    task = batch_tasks.pop(user_id, None)
-    if task and not task.done():
-        task.cancel()
+    await batch_scheduler.cancel_user(user_id)
     batch_states.pop(user_id, None)
     settings_states.pop(user_id, None)
 
     await unset_user_fields(user_id, ["session_string", "phone"])
+    # Pooled client band (shard me ho to wahan) + stored auth key/peers bhi hatao
+    await invalidate_user_client(user_id, drop_storage=True)
 
     await msg.reply_text(
         "🔓 Aap successfully logout ho gaye.\n"
@@ -784,8 +1221,11 @@ async def cmd_batch(client: Client, msg: Message):
     if not await check_force_sub_message(msg):
         return
 
-    if user_id in batch_tasks:
-        await msg.reply_text("Ek batch already chal raha hai. /cancel bhej kar phir se try karein. 🔄")
+    if not await batch_scheduler.can_queue(user_id):
+        await msg.reply_text(
+            f"Aapke {MAX_QUEUED_BATCHES_PER_USER} batches pehle se queue me hain. "
+            "Unke khatam hone ka intezaar karein ya /cancel bhejein. 🔄"
+        )
         return
 
     dest_chat_id = msg.chat.id
@@ -796,7 +1236,9 @@ async def cmd_batch(client: Client, msg: Message):
         "Ab us channel/chat ka message link bhejiye jahan se files nikalni hain. 💌\n"
         "Examples:\n"
         "• Public: https://t.me/channel_username/123\n"
-        "• Private: https://t.me/c/123456789/123\n\n"
+        "• Private: https://t.me/c/123456789/123\n"
+        "• Kai links / ranges ek saath (har line me ek): https://t.me/channel_username/10-25\n"
+        "• Ya links wali .txt file upload karein\n\n"
         f"Free users limit: {FREE_BATCH_LIMIT} messages\n"
         f"Premium/Owner limit: {MAX_BATCH_LIMIT} messages\n"
         f"Aapka current limit: {user_limit} messages\n"
@@ -804,6 +1246,49 @@ async def cmd_batch(client: Client, msg: Message):
     await log_to_channel(f"/batch started by {user_id} in {dest_chat_id}")
 
 
+# ---------- /resume (DM + Groups) ----------
+@bot.on_message(filters.command("resume") & (filters.private | filters.group))
+async def cmd_resume(client: Client, msg: Message):
+    user = msg.from_user
+    if not user:
+        return
+    user_id = user.id
+
+    if not await check_force_sub_message(msg):
+        return
+
+    doc = await get_user_doc(user_id)
+    entries = [h for h in doc.get("history") or [] if h.get("status") == "interrupted"]
+
+    if not entries:
+        await msg.reply_text("Koi ruka hua (interrupted) batch nahi mila. Naya /batch start karein. 🌸")
+        return
+
+    resumed = []
+    for entry in entries:
+        if not await batch_scheduler.can_queue(user_id):
+            break
+        if not await resume_batch_entry(user_id, entry):
+            await msg.reply_text("Ye batch user session se chal raha tha. Pehle /login karke phir /resume bhejiye. 🔐")
+            return
+        resumed.append(entry)
+
+    if not resumed:
+        await msg.reply_text("Queue abhi full hai. Thodi der baad /resume bhejiye. ⏳")
+        return
+
+    lines = [
+        f"• {e.get('processed', 0)}/{e.get('requested_count', 0)} ke baad se – {batch_job_label(e.get('link', ''))}"
+        for e in resumed
+    ]
+    await msg.reply_text(
+        "♻️ Batch resume ho gaya. 💌\n" + "\n".join(lines) + "\nCancel ke liye /cancel bhejiye."
+    )
+    await log_to_channel(
+        f"/resume by {user_id} for tasks {[e.get('task_id') for e in resumed]}"
+    )
+
+
 # ---------- Callback Query Handler ----------
 @bot.on_callback_query()
 async def on_callback(client: Client, cq: CallbackQuery):
@@ -969,6 +1454,7 @@ async def handle_session_login(msg: Message):
 
         new_session = await user_client.export_session_string()
         await set_user_field(user_id, "session_string", new_session)
+        await invalidate_user_client(user_id)
         await set_user_field(user_id, "phone", None)
 
         await msg.reply_text(
@@ -1131,6 +1617,7 @@ async def handle_phone_code(msg: Message):
 
     await set_user_field(user_id, "session_string", session_string)
     await set_user_field(user_id, "phone", phone)
+    await invalidate_user_client(user_id)
 
     await msg.reply_text(
         "💫 Phone + OTP login successful!\n"
@@ -1164,6 +1651,17 @@ async def start_qr_login(user_id: int, chat_id: int):
     )
 
     try:
+        # qrcode (+ Pillow) sirf yahin chahiye, startup pe load nahi karte
+        try:
+            import qrcode
+        except ImportError:
+            await bot.send_message(
+                chat_id,
+                "Is server pe QR login ke liye `qrcode`/Pillow install nahi hai. 😔\n"
+                "Please Session ya Phone+OTP method use karein."
+            )
+            return
+
         await user_client.connect()
 
         while True:
@@ -1217,6 +1715,7 @@ async def start_qr_login(user_id: int, chat_id: int):
 
         await set_user_field(user_id, "session_string", session_string)
         await set_user_field(user_id, "phone", None)
+        await invalidate_user_client(user_id)
 
         await bot.send_message(
             chat_id,
@@ -1250,6 +1749,16 @@ async def handle_batch_link(msg: Message):
     user_id = user.id
     text = (msg.text or "").strip()
 
+    if msg.document:
+        text = await read_link_list_file(msg)
+        if text is None:
+            await msg.reply_text("Sirf .txt file (har line me ek link) bhejiye. 📄")
+            return
+
+    if is_multi_batch_spec(text):
+        await handle_batch_spec(msg, text)
+        return
+
     try:
         chat_identifier, _ = parse_telegram_link(text)
         is_private = isinstance(chat_identifier, int)  # -100...
@@ -1268,20 +1777,87 @@ async def handle_batch_link(msg: Message):
     user_limit = await get_max_batch_limit(user_id)
     await msg.reply_text(
         f"Kitne messages nikalne hain? (Maximum {user_limit})\n"
-        "Sirf number bhejiye, example: 50 💌"
+        "Sirf number bhejiye, example: 50 💌\n"
+        "Ya `latest` – chat ke sabse naye message tak, `reverse` – naye se purane ki taraf (login zaruri)"
+    )
+
+
+async def read_link_list_file(msg: Message) -> Optional[str]:
+    """Uploaded .txt (links list) ka text; .txt na ho / bahut bada ho to None."""
+    doc = msg.document
+    is_txt = (doc.file_name or "").lower().endswith(".txt") or doc.mime_type == "text/plain"
+    if not is_txt or (doc.file_size or 0) > LINK_LIST_MAX_BYTES:
+        return None
+    buf = await bot.download_media(msg, in_memory=True)
+    return bytes(buf.getbuffer()).decode("utf-8", errors="ignore")
+
+
+async def handle_batch_spec(msg: Message, text: str):
+    """
+    Multi-link / range / .txt job: saare links ek job, count step nahi –
+    count = ranges ke total messages (user limit tak).
+    """
+    user_id = msg.from_user.id
+    try:
+        segments = parse_batch_spec(text)
+    except ValueError as e:
+        await msg.reply_text(f"Link list me galat entry hai: {e} 💔\nSahi links bhejiye.")
+        return
+
+    max_limit = await get_max_batch_limit(user_id)
+    total = batch_spec_count(segments)
+    if total > max_limit:
+        segments = truncate_batch_spec(segments, max_limit)
+        await msg.reply_text(
+            f"Total {total} messages hain, aapka limit {max_limit} hai. "
+            f"Pehle {max_limit} messages hi le paungi. 💫"
+        )
+        total = max_limit
+
+    state = batch_states.get(user_id, {})
+    dest_chat_id = state.get("dest_chat_id", msg.chat.id)
+    doc = await get_user_doc(user_id)
+    has_session = bool(doc.get("session_string"))
+    if any(isinstance(chat, int) for chat, _, _ in segments) and not has_session:
+        await msg.reply_text(
+            "List me private links hain. Inko access karne ke liye pehle /login karna hoga. 🔐"
+        )
+        batch_states.pop(user_id, None)
+        return
+
+    await queue_batch_job(
+        msg, user_id, format_batch_spec(segments), total, dest_chat_id, has_session
     )
 
 
 # ---------- History helpers ----------
-async def add_history_entry(user_id: int, task_id: str, link: str, count: int):
+async def add_history_entry(
+    user_id: int,
+    task_id: str,
+    link: str,
+    count: int,
+    dest_chat_id: Optional[int] = None,
+    use_user_session: Optional[bool] = None,
+    status: str = "queued",
+    mode: str = "count",
+):
     entry = {
         "task_id": task_id,
         "link": link,
         "requested_count": count,
+        # latest/reverse: count = cap (0 = no cap), asli total worker start pe set hota hai
+        "mode": mode,
+        "max_count": count,
         "start_time": datetime.now(timezone.utc),
-        "status": "running",
+        "status": status,
         "downloaded": 0,
         "errors": 0,
+        # resume ke liye
+        "dest_chat_id": dest_chat_id,
+        "use_user_session": use_user_session,
+        "checkpoint_msg_id": None,
+        "processed": 0,
+        "media": 0,
     }
     await users_coll.update_one(
         {"_id": user_id},
@@ -1290,6 +1866,47 @@ async def add_history_entry(user_id: int, task_id: str, link: str, count: int):
     )
 
 
+async def set_batch_total(user_id: int, task_id: str, total: int):
+    await users_coll.update_one(
+        {"_id": user_id, "history.task_id": task_id},
+        {"$set": {"history.$.requested_count": total}},
+    )
+
+
+async def set_batch_status(user_id: int, task_id: str, status: str):
+    await users_coll.update_one(
+        {"_id": user_id, "history.task_id": task_id},
+        {"$set": {"history.$.status": status}},
+    )
+
+
+async def checkpoint_batch_record(
+    user_id: int,
+    task_id: str,
+    last_msg_id: Optional[int],
+    processed: int,
+    downloaded_count: int,
+    error_count: int,
+    media_count: int,
+    status: Optional[str] = None,
+):
+    """Last completed source id + counters history entry me save (resume ke liye)."""
+    fields = {
+        "history.$.checkpoint_msg_id": last_msg_id,
+        "history.$.processed": processed,
+        "history.$.downloaded": downloaded_count,
+        "history.$.errors": error_count,
+        "history.$.media": media_count,
+        "history.$.checkpoint_at": datetime.now(timezone.utc),
+    }
+    if status:
+        fields["history.$.status"] = status
+    await users_coll.update_one(
+        {"_id": user_id, "history.task_id": task_id},
+        {"$set": fields},
+    )
+
+
 async def finalize_batch_record(
     user_id: int,
     task_id: str,
@@ -1330,24 +1947,32 @@ async def handle_batch_count(msg: Message):
     user_id = user.id
     text = (msg.text or "").strip()
 
-    # ---- count parse ----
-    try:
-        count = int(text)
-    except ValueError:
-        await msg.reply_text("Sirf integer number bhejiye, jaan. 💕")
-        return
-
     max_limit = await get_max_batch_limit(user_id)  # free=50, premium/owner=1000
 
-    if count <= 0:
-        await msg.reply_text("Number 1 se zyada hona chahiye. 🌸")
-        return
+    # ---- count parse ----
+    mode = BATCH_SPAN_MODES.get(text.lower(), "count")
+    if mode != "count":
+        # Chat ke latest message tak: premium/owner bina cap, free users apne limit tak
+        count = 0 if max_limit >= MAX_BATCH_LIMIT else max_limit
+    else:
+        try:
+            count = int(text)
+        except ValueError:
+            await msg.reply_text(
+                "Sirf integer number bhejiye, jaan. 💕\n"
+                "(Ya `latest` – latest message tak, `reverse` – latest se ulta)"
+            )
+            return
 
-    if count > max_limit:
-        await msg.reply_text(
-            f"Aapka limit {max_limit} hai. Main {max_limit} messages tak hi le paungi. 💫"
-        )
-        count = max_limit
+        if count <= 0:
+            await msg.reply_text("Number 1 se zyada hona chahiye. 🌸")
+            return
+
+        if count > max_limit:
+            await msg.reply_text(
+                f"Aapka limit {max_limit} hai. Main {max_limit} messages tak hi le paungi. 💫"
+            )
+            count = max_limit
 
     # ---- state check ----
     state = batch_states.get(user_id)
@@ -1364,6 +1989,14 @@ async def handle_batch_count(msg: Message):
     doc = await get_user_doc(user_id)
     has_session = bool(doc.get("session_string"))
 
+    # Latest message dhoondhna (getHistory) bots nahi kar sakte
+    if mode != "count" and not has_session:
+        await msg.reply_text(
+            "`latest` / `reverse` mode ke liye pehle /login karna hoga. 🔐"
+        )
+        batch_states.pop(user_id, None)
+        return
+
     # Private (/c) ke liye session jaruri
     if is_private and not has_session:
         await msg.reply_text(
@@ -1372,93 +2005,943 @@ async def handle_batch_count(msg: Message):
         batch_states.pop(user_id, None)
         return
 
-    # Task id + history
+    # Agar session hai -> user-session se clone (ANY chat jahan user member ho)
+    await queue_batch_job(msg, user_id, link, count, dest_chat_id, has_session, mode)
+
+
+async def queue_batch_job(
+    msg: Message,
+    user_id: int,
+    link: str,
+    count: int,
+    dest_chat_id: int,
+    use_user_session: bool,
+    mode: str = "count",
+):
+    """History entry + scheduler submit + user ko start/queue reply."""
     task_id = datetime.now(timezone.utc).isoformat()
 
-    # Agar session hai -> user-session se clone (ANY chat jahan user member ho)
-    use_user_session = has_session
+    # Dialog khatam – ab job scheduler ke paas, user naya /batch queue kar sakta hai
+    batch_states.pop(user_id, None)
 
-    batch_states[user_id] = {
-        "step": "running",
-        "link": link,
-        "task_id": task_id,
-        "is_private": is_private,
-        "use_user_session": use_user_session,
-        "dest_chat_id": dest_chat_id,
-    }
+    await add_history_entry(
+        user_id, task_id, link, count, dest_chat_id, use_user_session, mode=mode
+    )
 
-    await add_history_entry(user_id, task_id, link, count)
+    position = await submit_batch(
+        user_id, dest_chat_id, link, count, task_id, use_user_session, mode=mode
+    )
 
-    if use_user_session:
-        task = asyncio.create_task(batch_worker_private(user_id, dest_chat_id, link, count, task_id))
+    if mode == "latest":
+        what = "chat ke latest message tak"
+    elif mode == "reverse":
+        what = "latest message se ulte order me link tak"
     else:
-        task = asyncio.create_task(batch_worker_public(user_id, dest_chat_id, link, count, task_id))
+        what = f"{count} messages"
+    if mode != "count" and count:
+        what += f" (max {count})"
+
+    if position < 0:
+        await set_batch_status(user_id, task_id, "error")
+        await msg.reply_text("Ye batch pehle se chal raha hai, dobara queue nahi hua. 🌸")
+        return
 
-    batch_tasks[user_id] = task
+    if position:
+        await msg.reply_text(
+            f"⏳ Batch queue me daal diya (position {position}). {what} ka batch "
+            "slot free hote hi shuru ho jayega. 💌\n"
+            "Cancel ke liye /cancel bhejiye."
+        )
+        return
 
     await msg.reply_text(
-        f"Batch start ho gaya. {count} messages fetch karne ki koshish hogi. 💌\n"
-        f"Har message ke beech ~{SLEEP_SECONDS} sec wait hoga (flood se bachne ke liye). ⏳\n"
+        f"Batch start ho gaya. {what} fetch karne ki koshish hogi. 💌\n"
+        "Speed Telegram ke flood limits ke hisaab se apne aap adjust hogi. ⏳\n"
         "Cancel ke liye /cancel bhejiye."
     )
 
 
-# ---------- Settings: Set Chat ID ----------
-async def handle_settings_chat_id(msg: Message):
-    user_id = msg.from_user.id
-    text = (msg.text or "").strip()
+# ---------- BATCH SCHEDULER ----------
+class BatchScheduler:
+    """
+    Global batch scheduler:
+    - poore instance me max `slots` batches ek saath
+    - har user ka ek time pe ek batch chalta hai, baaki uski queue me wait
+    - slot free hote hi users round-robin me admit hote hain (fairness)
+    """
 
-    try:
-        chat_id = int(text)
-    except ValueError:
-        await msg.reply_text("Chat ID integer hona chahiye (example: -1001234567890). 💕")
-        return
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.queues: Dict[int, collections.deque] = {}
+        self.rotation: collections.deque = collections.deque()
+        self.running_jobs: Dict[int, Dict[str, Any]] = {}
 
-    await set_user_field(user_id, "set_chat_id", chat_id)
-    settings_states.pop(user_id, None)
-    await msg.reply_text(f"Set Chat ID saved: {chat_id} ✅")
+    def start(self):
+        pass
 
+    async def close(self):
+        pass
 
-# ---------- Settings: Remove Words ----------
-async def handle_remove_words(msg: Message):
-    user_id = msg.from_user.id
-    text = (msg.text or "").strip()
+    async def queued_count(self, user_id: int) -> int:
+        return len(self.queues.get(user_id) or ())
 
-    if not text:
-        await msg.reply_text(
-            "Koi words nahi mile. Agar remove words clear karne hain to `reset` likh kar bhejo, "
-            "warna comma se separated words bhejo. 💕"
+    async def can_queue(self, user_id: int) -> bool:
+        return await self.queued_count(user_id) < MAX_QUEUED_BATCHES_PER_USER
+
+    async def is_running(self, user_id: int) -> bool:
+        return user_id in batch_tasks
+
+    async def active_job(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self.running_jobs.get(user_id)
+
+    def summary(self) -> str:
+        waiting = sum(len(q) for q in self.queues.values())
+        return (
+            f"scheduler: {len(batch_tasks)}/{self.slots} running, {waiting} queued, "
+            f"{len(self.queues)} users waiting"
         )
-        return
 
-    if text.lower() in ("reset", "clear"):
-        await set_user_field(user_id, "remove_words", [])
-        settings_states.pop(user_id, None)
-        await msg.reply_text("Remove words list clear kar di gayi hai. 🌸")
-        return
+    async def submit(self, job: Dict[str, Any]) -> int:
+        """Job queue me daalo; 0 = turant start, -1 = reject (job pehle se chal raha), warna queue position."""
+        user_id = job["user_id"]
+        self.queues.setdefault(user_id, collections.deque()).append(job)
+        if user_id not in self.rotation:
+            self.rotation.append(user_id)
+        self._pump()
+        queue = self.queues.get(user_id)
+        if queue and job in queue:
+            return list(queue).index(job) + 1
+        return 0
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        for _ in range(len(self.rotation)):
+            user_id = self.rotation[0]
+            self.rotation.rotate(-1)
+            if user_id in batch_tasks:
+                continue
+            queue = self.queues.get(user_id)
+            if not queue:
+                continue
+            job = queue.popleft()
+            if not queue:
+                self.queues.pop(user_id, None)
+                self.rotation.remove(user_id)
+            return job
+        return None
+
+    def _pump(self):
+        if shutting_down:
+            return
+        while len(batch_tasks) < self.slots:
+            job = self._next_job()
+            if not job:
+                break
+            self._start(job)
+
+    def _start(self, job: Dict[str, Any]):
+        user_id = job["user_id"]
+        task = asyncio.create_task(self._run(job))
+        batch_tasks[user_id] = task
+        self.running_jobs[user_id] = job
+        task.add_done_callback(lambda t, uid=user_id: self._on_done(uid, t))
+
+    async def _run(self, job: Dict[str, Any]) -> Optional[str]:
+        await set_batch_status(job["user_id"], job["task_id"], "running")
+        if worker_shards.enabled:
+            return await worker_shards.run(job)
+        return await run_batch_job(job)
+
+    def _on_done(self, user_id: int, task: asyncio.Task):
+        if batch_tasks.get(user_id) is task:
+            batch_tasks.pop(user_id, None)
+            self.running_jobs.pop(user_id, None)
+        self._pump()
+
+    async def cancel_user(self, user_id: int) -> bool:
+        """User ke queued jobs hatao + running batch cancel. Kuch cancel hua to True."""
+        cancelled = False
+        queue = self.queues.pop(user_id, None)
+        if user_id in self.rotation:
+            self.rotation.remove(user_id)
+        for job in queue or ():
+            cancelled = True
+            try:
+                await set_batch_status(user_id, job["task_id"], "cancelled")
+            except Exception:
+                pass
+        task = batch_tasks.get(user_id)
+        if task and not task.done():
+            task.cancel()
+            cancelled = True
+        return cancelled
 
-    parts = [w.strip() for w in text.split(",") if w.strip()]
-    await set_user_field(user_id, "remove_words", parts)
-    settings_states.pop(user_id, None)
-    await msg.reply_text(
-        "Remove words list set ho gayi hai:\n" + ", ".join(parts)
-    )
 
+class MongoBatchScheduler(BatchScheduler):
+    """
+    JOB_QUEUE=mongo: jobs `jobs` collection me, kai replicas ek hi queue se kaam
+    uthate hain (local slots/worker BatchScheduler wale hi).
+    - claim: find_one_and_update (queued / lease expired -> running, owner + lease)
+    - per-user single-flight: `job_locks` me user_id _id wala lock, lease ke saath
+    - heartbeat: apne jobs + locks ka lease badhao, doosre replica ka /cancel dekho
+    - replica mar gaya -> lease expire, koi bhi replica checkpoint se resume karta hai
+    - fairness: har job ka `turn` (user ke kitne jobs aage the) -> users round-robin
+    """
 
-# ---------- TEXT ROUTER ----------
-@bot.on_message(
-    (filters.private | filters.group)
-    & ~filters.command(
-        [
-            "start",
-            "help",
-            "status",
+    def __init__(self, slots: int):
+        super().__init__(slots)
+        self.claim_lock = asyncio.Lock()
+        self.finalizers: set = set()
+        self.claims: set = set()  # _pump ke claim rounds (reference na ho to GC task ko kha sakta hai)
+        self.loop_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def job_key(user_id: int, task_id: str) -> str:
+        return f"{user_id}:{task_id}"
+
+    def start(self):
+        self.loop_task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self.loop_task:
+            self.loop_task.cancel()
+        for claim in list(self.claims):
+            claim.cancel()
+        if self.finalizers:
+            await asyncio.wait(list(self.finalizers), timeout=10)
+
+    async def ensure_indexes(self):
+        await jobs_coll.create_index([("status", 1), ("turn", 1), ("created", 1)])
+        await jobs_coll.create_index([("user_id", 1), ("status", 1)])
+        # Khatam jobs (done/cancelled) hafte bhar baad apne aap hat jaate hain
+        await jobs_coll.create_index("finished", expireAfterSeconds=7 * 24 * 3600)
+
+    async def queued_count(self, user_id: int) -> int:
+        return await jobs_coll.count_documents({"user_id": user_id, "status": "queued"})
+
+    async def is_running(self, user_id: int) -> bool:
+        lock = await job_locks_coll.find_one(
+            {"_id": user_id, "lease_until": {"$gt": datetime.now(timezone.utc)}}
+        )
+        return lock is not None
+
+    async def active_job(self, user_id: int) -> Optional[Dict[str, Any]]:
+        doc = await jobs_coll.find_one(
+            {
+                "user_id": user_id,
+                "status": "running",
+                "lease_until": {"$gt": datetime.now(timezone.utc)},
+            }
+        )
+        return doc["job"] if doc else None
+
+    def summary(self) -> str:
+        return f"job queue (mongo, {REPLICA_ID}): {len(batch_tasks)}/{self.slots} running here"
+
+    async def submit(self, job: Dict[str, Any]) -> int:
+        user_id = job["user_id"]
+        key = self.job_key(user_id, job["task_id"])
+        turn = await jobs_coll.count_documents(
+            {"user_id": user_id, "status": {"$in": ["queued", "running"]}, "_id": {"$ne": key}}
+        )
+        now = datetime.now(timezone.utc)
+        try:
+            # Resume pe wahi job doc dobara queue (chal raha ho to duplicate nahi)
+            await jobs_coll.update_one(
+                {"_id": key, "status": {"$ne": "running"}},
+                {
+                    "$set": {
+                        "user_id": user_id,
+                        "job": job,
+                        "status": "queued",
+                        "turn": turn,
+                        "created": now,
+                        "cancel_requested": False,
+                    },
+                    "$setOnInsert": {"attempts": 0},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return -1  # wahi job doosre replica pe running hai
+        await self._claim_round()
+        doc = await jobs_coll.find_one({"_id": key}, {"status": 1})
+        if not doc or doc["status"] != "queued":
+            return 0
+        return await jobs_coll.count_documents(
+            {"user_id": user_id, "status": "queued", "turn": {"$lte": turn}}
+        )
+
+    def _pump(self):
+        if not shutting_down:
+            claim = asyncio.create_task(self._claim_round())
+            self.claims.add(claim)
+            claim.add_done_callback(self.claims.discard)
+
+    async def _claim_round(self):
+        async with self.claim_lock:
+            while len(batch_tasks) < self.slots and not shutting_down:
+                job = await self._claim_one()
+                if not job:
+                    return
+                self._start(job)
+
+    async def _claim_one(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        claimable = {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_until": {"$lt": now}},
+            ]
+        }
+        busy = await job_locks_coll.distinct("_id", {"lease_until": {"$gt": now}})
+        cursor = (
+            jobs_coll.find({**claimable, "user_id": {"$nin": busy}})
+            .sort([("turn", 1), ("created", 1)])
+            .limit(50)
+        )
+        async for doc in cursor:
+            user_id = doc["user_id"]
+            if user_id in batch_tasks or not await self._lock_user(user_id, doc["_id"]):
+                continue
+            claimed = await jobs_coll.find_one_and_update(
+                {"_id": doc["_id"], **claimable},
+                {
+                    "$set": {
+                        "status": "running",
+                        "owner": REPLICA_ID,
+                        "lease_until": now + timedelta(seconds=JOB_LEASE_TTL),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if not claimed:
+                await self._unlock_user(user_id, doc["_id"])
+                continue
+            job = dict(claimed["job"])
+            if claimed["attempts"] > 1:
+                # Pichla owner beech me mar gaya -> last checkpoint se aage
+                entry = await find_history_entry(user_id, job["task_id"])
+                if entry:
+                    job["resume"] = checkpoint_resume(entry)
+            return job
+        return None
+
+    async def _lock_user(self, user_id: int, key: str) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await job_locks_coll.update_one(
+                # Sirf expired lock ya apna hi (same job) lock -> doosre replica ka lock kabhi overwrite nahi
+                {
+                    "_id": user_id,
+                    "$or": [{"lease_until": {"$lt": now}}, {"job": key, "owner": REPLICA_ID}],
+                },
+                {
+                    "$set": {
+                        "owner": REPLICA_ID,
+                        "job": key,
+                        "lease_until": now + timedelta(seconds=JOB_LEASE_TTL),
+                    }
+                },
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _unlock_user(self, user_id: int, key: str):
+        await job_locks_coll.delete_one({"_id": user_id, "owner": REPLICA_ID, "job": key})
+
+    def _on_done(self, user_id: int, task: asyncio.Task):
+        job = self.running_jobs.get(user_id) if batch_tasks.get(user_id) is task else None
+        if job:
+            finalizer = asyncio.create_task(self._finish(job, task))
+            self.finalizers.add(finalizer)
+            finalizer.add_done_callback(self.finalizers.discard)
+        super()._on_done(user_id, task)
+
+    async def _finish(self, job: Dict[str, Any], task: asyncio.Task):
+        user_id = job["user_id"]
+        key = self.job_key(user_id, job["task_id"])
+        if (user_id, job["task_id"]) in handed_off_batches:
+            # Lease kho gaya: job ab doosre replica ka hai, uska doc/lock nahi chhuna
+            handed_off_batches.discard((user_id, job["task_id"]))
+            self._pump()
+            return
+        # Workers CancelledError khud sambhal ke status lautate hain -> task.cancelled() kam hi sach
+        if task.cancelled():
+            outcome = "interrupted" if shutting_down else "cancelled"
+        elif task.exception():
+            outcome = "error"
+        else:
+            outcome = task.result()
+        if outcome in ("completed", "error"):
+            status = "done"
+        elif outcome == "cancelled":
+            status = "cancelled"
+        elif AUTO_RESUME_BATCHES and shutting_down:
+            status = "queued"  # restart/deploy: koi bhi replica checkpoint se uthaye
+        else:
+            status = "interrupted"  # user /resume se wapas queue karega
+        try:
+            fields: Dict[str, Any] = {"status": status}
+            if status in ("done", "cancelled"):
+                fields["finished"] = datetime.now(timezone.utc)
+            await jobs_coll.update_one({"_id": key, "owner": REPLICA_ID}, {"$set": fields})
+            await self._unlock_user(user_id, key)
+        except Exception as e:
+            print(f"[JOBS] finish {key} failed: {e}")
+        self._pump()
+
+    async def cancel_user(self, user_id: int) -> bool:
+        cancelled = False
+        async for doc in jobs_coll.find({"user_id": user_id, "status": "queued"}, {"job": 1}):
+            res = await jobs_coll.update_one(
+                {"_id": doc["_id"], "status": "queued"}, {"$set": {"status": "cancelled"}}
+            )
+            if res.modified_count:
+                cancelled = True
+                try:
+                    await set_batch_status(user_id, doc["job"]["task_id"], "cancelled")
+                except Exception:
+                    pass
+        # Running job kisi bhi replica pe ho -> flag; owner heartbeat pe cancel karega
+        res = await jobs_coll.update_many(
+            {"user_id": user_id, "status": "running"}, {"$set": {"cancel_requested": True}}
+        )
+        if res.modified_count:
+            cancelled = True
+        task = batch_tasks.get(user_id)
+        if task and not task.done():
+            task.cancel()
+            cancelled = True
+        return cancelled
+
+    async def _heartbeat(self):
+        jobs = list(self.running_jobs.values())
+        if not jobs:
+            return
+        lease_until = datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_TTL)
+        for job in jobs:
+            user_id = job["user_id"]
+            key = self.job_key(user_id, job["task_id"])
+            task = batch_tasks.get(user_id)
+            doc = await jobs_coll.find_one_and_update(
+                {"_id": key, "owner": REPLICA_ID, "status": "running"},
+                {"$set": {"lease_until": lease_until}},
+                projection={"cancel_requested": 1},
+            )
+            await job_locks_coll.update_one(
+                {"_id": user_id, "owner": REPLICA_ID, "job": key},
+                {"$set": {"lease_until": lease_until}},
+            )
+            if doc is None:
+                print(f"[JOBS] lease lost for {key}, stopping local copy")
+                handed_off_batches.add((user_id, job["task_id"]))
+            if (doc is None or doc.get("cancel_requested")) and task and not task.done():
+                task.cancel()
+
+    async def _loop(self):
+        await self.ensure_indexes()
+        last_beat = 0.0
+        while True:
+            try:
+                if time.time() - last_beat >= JOB_HEARTBEAT_INTERVAL:
+                    last_beat = time.time()
+                    await self._heartbeat()
+                await self._claim_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[JOBS] scheduler loop: {e}")
+            await asyncio.sleep(min(JOB_POLL_INTERVAL, JOB_HEARTBEAT_INTERVAL))
+
+
+batch_scheduler = (
+    MongoBatchScheduler(MAX_ACTIVE_BATCHES)
+    if JOB_QUEUE == "mongo"
+    else BatchScheduler(MAX_ACTIVE_BATCHES)
+)
+
+
+async def run_batch_job(job: Dict[str, Any]) -> str:
+    """Worker chalao; final status (completed/error/cancelled/interrupted/handed_off) lautao."""
+    worker = batch_worker_private if job["use_user_session"] else batch_worker_public
+    return await worker(
+        job["user_id"],
+        job["dest_chat_id"],
+        job["link"],
+        job["count"],
+        job["task_id"],
+        job.get("resume"),
+        job.get("mode", "count"),
+    )
+
+download_slots = asyncio.Semaphore(GLOBAL_MAX_DOWNLOADS)   # poore instance me parallel downloads
+upload_slots = asyncio.Semaphore(GLOBAL_MAX_UPLOADS)       # poore instance me parallel uploads
+
+
+async def submit_batch(
+    user_id: int,
+    dest_chat_id: int,
+    link: str,
+    count: int,
+    task_id: str,
+    use_user_session: bool,
+    resume: Optional[Dict[str, Any]] = None,
+    mode: str = "count",
+) -> int:
+    return await batch_scheduler.submit(
+        {
+            "user_id": user_id,
+            "dest_chat_id": dest_chat_id,
+            "link": link,
+            "count": count,
+            "task_id": task_id,
+            "use_user_session": use_user_session,
+            "resume": resume,
+            "mode": mode,
+        }
+    )
+
+
+# ---------- Resume (restart/crash ke baad) ----------
+def checkpoint_resume(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """History entry ke checkpoint se worker ka resume dict."""
+    return {
+        "checkpoint_msg_id": entry.get("checkpoint_msg_id"),
+        "processed": entry.get("processed", 0),
+        "downloaded": entry.get("downloaded", 0),
+        "errors": entry.get("errors", 0),
+        "media": entry.get("media", 0),
+    }
+
+
+async def find_history_entry(user_id: int, task_id: str) -> Optional[Dict[str, Any]]:
+    doc = await users_coll.find_one(
+        {"_id": user_id, "history.task_id": task_id}, {"history.$": 1}
+    )
+    return (doc.get("history") or [None])[0] if doc else None
+
+
+async def resume_batch_entry(user_id: int, entry: Dict[str, Any]) -> bool:
+    """Interrupted history entry ko uske checkpoint se dobara chalata hai."""
+    doc = await get_user_doc(user_id)
+    use_user_session = entry.get("use_user_session")
+    if use_user_session is None:
+        use_user_session = bool(doc.get("session_string"))
+    if use_user_session and not doc.get("session_string"):
+        return False
+
+    dest_chat_id = entry.get("dest_chat_id") or user_id
+    resume = checkpoint_resume(entry)
+    mode = entry.get("mode", "count")
+    # Span modes me cap (max_count) jata hai, total worker dobara nikalta hai
+    count = entry.get("max_count", 0) if mode != "count" else entry.get("requested_count", 0)
+    await set_batch_status(user_id, entry["task_id"], "queued")
+    position = await submit_batch(
+        user_id,
+        dest_chat_id,
+        entry["link"],
+        count,
+        entry["task_id"],
+        use_user_session,
+        resume,
+        mode,
+    )
+    if position < 0:
+        # Kisi replica pe ye job abhi chal raha hai -> wahi status rehne do
+        await set_batch_status(user_id, entry["task_id"], "running")
+    return True
+
+
+async def recover_interrupted_batches():
+    """
+    Startup pe: jo history entries abhi bhi 'running' hain wo pichle process ke
+    saath mar gaye (running/queued) -> 'interrupted'. Unke aur pichle shutdown pe
+    ruke (restart_pending) batches ke liye user ko ek hi baar /resume batao (ya
+    auto-resume); purane, pehle bataye ja chuke interrupted entries ko nahi.
+    JOB_QUEUE=mongo me ye kaam leases karte hain (doosre replicas ke running
+    jobs ko yahan se chhedna nahi).
+    """
+    if JOB_QUEUE == "mongo":
+        return
+    async for doc in users_coll.find(
+        {
+            "$or": [
+                {"history.status": {"$in": ["running", "queued"]}},
+                {"history.restart_pending": True},
+            ]
+        },
+        {"history": 1},
+    ):
+        user_id = doc["_id"]
+        interrupted = []
+        for h in doc.get("history") or []:
+            if h.get("status") in ("running", "queued"):
+                await set_batch_status(user_id, h.get("task_id"), "interrupted")
+                h["status"] = "interrupted"
+            elif not h.get("restart_pending"):
+                continue
+            if h.get("restart_pending"):
+                await users_coll.update_one(
+                    {"_id": user_id, "history.task_id": h.get("task_id")},
+                    {"$unset": {"history.$.restart_pending": ""}},
+                )
+            if h.get("status") == "interrupted":
+                interrupted.append(h)
+        if not interrupted:
+            continue
+
+        if AUTO_RESUME_BATCHES:
+            try:
+                resumed = [
+                    h for h in interrupted[-MAX_QUEUED_BATCHES_PER_USER:]
+                    if await resume_batch_entry(user_id, h)
+                ]
+                if resumed:
+                    await bot.send_message(
+                        user_id,
+                        "♻️ Bot restart ke baad tumhara batch wahi se dobara shuru kar diya hai. 💞",
+                    )
+                    continue
+            except Exception as e:
+                await log_to_channel(f"Auto-resume failed for {user_id}: {e}")
+        try:
+            await bot.send_message(
+                user_id,
+                "⚠️ Bot restart ki wajah se tumhara batch beech me ruk gaya tha.\n"
+                "/resume bhejo, main wahi se continue karungi jahan ruki thi. 💌",
+            )
+        except Exception:
+            pass
+
+
+async def shutdown_batches(timeout: float = 20):
+    """Shutdown pe chal rahe batches ko 'interrupted' checkpoint ke saath rok do."""
+    global shutting_down
+    shutting_down = True
+    # Queued jobs history me 'queued' hi rehte hain -> agle startup pe interrupted
+    batch_scheduler.queues.clear()
+    batch_scheduler.rotation.clear()
+    tasks = [t for t in batch_tasks.values() if not t.done()]
+    for t in tasks:
+        t.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+    await batch_scheduler.close()
+
+
+# ---------- MULTI-PROCESS BATCH WORKERS (user_id shards) ----------
+class WorkerShards:
+    """
+    BATCH_WORKER_PROCESSES > 0 pe batches alag processes me chalte hain (har ek ka
+    apna event loop, bot session, user client pool, uploaders). Job user_id % N
+    wale shard pe jaata hai, taaki ek user ka pooled client ek hi process me rahe.
+    Front process sirf commands, state aur scheduler (slots/fairness) sambhalta hai.
+    Shard mar jaaye to uske batches 'interrupted' (/resume) aur process dobara start.
+    """
+
+    def __init__(self, count: int):
+        self.count = max(0, count)
+        self.ctx = multiprocessing.get_context("spawn")
+        self.procs: List[Any] = []
+        self.inboxes: List[Any] = []
+        self.outbox: Any = None
+        self.pending: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.shard_of: Dict[Tuple[int, str], int] = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.watcher: Optional[asyncio.Task] = None
+        self.reports: Dict[int, Tuple[str, float]] = {}  # shard -> (last stats text, kab aaya)
+        self.temp_usage: Dict[int, Dict[int, int]] = {}  # shard -> user_id -> temp bytes (last report)
+
+    @property
+    def enabled(self) -> bool:
+        return self.count > 0
+
+    def shard_for(self, user_id: int) -> int:
+        return user_id % self.count
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.outbox = self.ctx.Queue()
+        self.procs = [None] * self.count
+        self.inboxes = [None] * self.count
+        for index in range(self.count):
+            self._spawn(index)
+        threading.Thread(target=self._read_outbox, daemon=True).start()
+        self.watcher = asyncio.create_task(self._watch())
+
+    def _spawn(self, index: int):
+        inbox = self.ctx.Queue()
+        proc = self.ctx.Process(
+            target=shard_process_main,
+            args=(index, inbox, self.outbox),
+            name=f"serena-shard-{index}",
+            daemon=True,
+        )
+        proc.start()
+        self.inboxes[index] = inbox
+        self.procs[index] = proc
+
+    def _read_outbox(self):
+        while True:
+            event = self.outbox.get()
+            if event is None:
+                return
+            self.loop.call_soon_threadsafe(self._on_event, event)
+
+    def _on_event(self, event: Tuple):
+        if event[0] == "done":
+            _, user_id, task_id, status = event
+            self._resolve((user_id, task_id), status)
+        elif event[0] == "report":
+            _, index, text, temp_usage = event
+            self.reports[index] = (text, time.time())
+            self.temp_usage[index] = temp_usage
+
+    def _resolve(self, key: Tuple[int, str], status: Optional[str] = None):
+        self.shard_of.pop(key, None)
+        fut = self.pending.pop(key, None)
+        if fut and not fut.done():
+            fut.set_result(status)
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(5)
+            for index, proc in enumerate(self.procs):
+                if proc.is_alive():
+                    continue
+                print(f"[SHARDS] shard {index} exited ({proc.exitcode}), restarting")
+                for key in [k for k, i in self.shard_of.items() if i == index]:
+                    try:
+                        await set_batch_status(key[0], key[1], "interrupted")
+                    except Exception:
+                        pass
+                    self._resolve(key)
+                self._spawn(index)
+
+    async def run(self, job: Dict[str, Any]) -> Optional[str]:
+        """Job shard ko bhejo, khatam hone tak ruko aur worker ka status lautao (shard mara -> None)."""
+        key = (job["user_id"], job["task_id"])
+        shard = self.shard_for(job["user_id"])
+        fut = self.loop.create_future()
+        self.pending[key] = fut
+        self.shard_of[key] = shard
+        self.inboxes[shard].put(("run", job))
+        try:
+            return await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            handed_off = key in handed_off_batches
+            self.inboxes[shard].put(("cancel", job["user_id"], shutting_down, handed_off))
+            try:
+                return await asyncio.wait_for(asyncio.shield(fut), SHARD_CANCEL_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                pass
+            raise
+        finally:
+            self.pending.pop(key, None)
+            self.shard_of.pop(key, None)
+
+    def invalidate_user(self, user_id: int, drop_storage: bool = False):
+        """User ka pooled client usi shard me band ho (front ke pool me wo hota hi nahi)."""
+        self.inboxes[self.shard_for(user_id)].put(("invalidate", user_id, drop_storage))
+
+    def user_temp_usage(self, user_id: int) -> int:
+        return self.temp_usage.get(self.shard_for(user_id), {}).get(user_id, 0)
+
+    def report(self) -> str:
+        """Har shard ke apne pools/transfers ke stats (shards har SHARD_REPORT_INTERVAL bhejte hain)."""
+        lines = []
+        for index in range(self.count):
+            text, at = self.reports.get(index, ("no report yet", 0.0))
+            age = f" ({int(time.time() - at)}s ago)" if at else ""
+            lines.append(f"[shard #{index}{age}]\n{text}")
+        return "\n".join(lines)
+
+    async def stop(self, timeout: float = 10):
+        if not self.procs:
+            return
+        if self.watcher:
+            self.watcher.cancel()
+        for inbox in self.inboxes:
+            inbox.put(("stop",))
+        for proc in self.procs:
+            await self.loop.run_in_executor(None, proc.join, timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self.outbox.put(None)
+
+    def summary(self) -> str:
+        alive = sum(1 for p in self.procs if p and p.is_alive())
+        per_shard = collections.Counter(self.shard_of.values())
+        load = ", ".join(f"#{i}: {per_shard.get(i, 0)}" for i in range(self.count))
+        return f"shards: {alive}/{self.count} alive, running {load}"
+
+
+worker_shards = WorkerShards(BATCH_WORKER_PROCESSES)
+
+
+def shard_process_main(index: int, inbox: Any, outbox: Any):
+    """Shard process (spawn) ka entry: wahi bot object, apne session naam se, bina updates."""
+    bot.name = f"serena_shard_{index}"
+    bot.no_updates = True
+    use_persistent_storage(bot)
+    bot.run(shard_main(index, inbox, outbox))
+
+
+async def shard_main(index: int, inbox: Any, outbox: Any):
+    """Front se aaye run/cancel/stop commands chalata hai; har batch ke baad 'done' bhejta hai."""
+    global shutting_down
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    background: set = set()
+    jobs: Dict[int, Dict[str, Any]] = {}  # user_id -> chal raha job (cancel pe task_id chahiye)
+
+    def spawn(coro: Awaitable):
+        task = asyncio.create_task(coro)
+        background.add(task)
+        task.add_done_callback(background.discard)
+
+    def finish(job: Dict[str, Any], task: asyncio.Task):
+        if batch_tasks.get(job["user_id"]) is task:
+            batch_tasks.pop(job["user_id"], None)
+            jobs.pop(job["user_id"], None)
+        handed_off_batches.discard((job["user_id"], job["task_id"]))
+        if task.cancelled():
+            status = "interrupted" if shutting_down else "cancelled"
+        elif task.exception():
+            print(f"[SHARD {index}] batch {job['task_id']} failed: {task.exception()}")
+            status = "error"
+        else:
+            status = task.result()
+        outbox.put(("done", job["user_id"], job["task_id"], status))
+
+    def on_command(cmd: Tuple):
+        global shutting_down
+        if cmd[0] == "run":
+            job = cmd[1]
+            task = asyncio.create_task(run_batch_job(job))
+            batch_tasks[job["user_id"]] = task
+            jobs[job["user_id"]] = job
+            task.add_done_callback(lambda t, j=job: finish(j, t))
+        elif cmd[0] == "cancel":
+            _, user_id, shutdown, handed_off = cmd
+            if shutdown:
+                shutting_down = True
+            task = batch_tasks.get(user_id)
+            if task and not task.done():
+                if handed_off:
+                    handed_off_batches.add((user_id, jobs[user_id]["task_id"]))
+                task.cancel()
+        elif cmd[0] == "invalidate":
+            _, user_id, drop_storage = cmd
+            spawn(user_client_pool.invalidate(user_id, drop_storage))
+        elif cmd[0] == "stop":
+            stop.set()
+
+    async def report_loop():
+        while True:
+            text = "\n".join(
+                [
+                    file_cache_summary(),
+                    transfer_timings_summary(),
+                    memory_pool.summary(),
+                    temp_storage.summary(),
+                    user_client_pool.summary(),
+                    uploader_pool.summary(),
+                ]
+            )
+            outbox.put(("report", index, text, dict(temp_storage.user_used)))
+            await asyncio.sleep(SHARD_REPORT_INTERVAL)
+
+    def read_inbox():
+        while True:
+            cmd = inbox.get()
+            loop.call_soon_threadsafe(on_command, cmd)
+            if cmd[0] == "stop":
+                return
+
+    await bot.start()
+    await uploader_pool.start(UPLOADER_BOT_TOKENS, prefix=bot.name)
+    janitor = asyncio.create_task(user_client_janitor())
+    reporter = asyncio.create_task(report_loop())
+    threading.Thread(target=read_inbox, daemon=True).start()
+    print(f"[SHARD {index}] ready (pid {os.getpid()})")
+
+    await stop.wait()
+    shutting_down = True
+    tasks = [t for t in batch_tasks.values() if not t.done()]
+    for t in tasks:
+        t.cancel()
+    if tasks:
+        await asyncio.wait(tasks, timeout=SHARD_CANCEL_TIMEOUT)
+    janitor.cancel()
+    reporter.cancel()
+    if background:
+        await asyncio.wait(list(background), timeout=SHARD_CANCEL_TIMEOUT)
+    await user_client_pool.close_all()
+    await uploader_pool.stop()
+    await bot.stop()
+
+
+# ---------- Settings: Set Chat ID ----------
+async def handle_settings_chat_id(msg: Message):
+    user_id = msg.from_user.id
+    text = (msg.text or "").strip()
+
+    try:
+        chat_id = int(text)
+    except ValueError:
+        await msg.reply_text("Chat ID integer hona chahiye (example: -1001234567890). 💕")
+        return
+
+    await set_user_field(user_id, "set_chat_id", chat_id)
+    settings_states.pop(user_id, None)
+    await msg.reply_text(f"Set Chat ID saved: {chat_id} ✅")
+
+
+# ---------- Settings: Remove Words ----------
+async def handle_remove_words(msg: Message):
+    user_id = msg.from_user.id
+    text = (msg.text or "").strip()
+
+    if not text:
+        await msg.reply_text(
+            "Koi words nahi mile. Agar remove words clear karne hain to `reset` likh kar bhejo, "
+            "warna comma se separated words bhejo. 💕"
+        )
+        return
+
+    if text.lower() in ("reset", "clear"):
+        await set_user_field(user_id, "remove_words", [])
+        settings_states.pop(user_id, None)
+        await msg.reply_text("Remove words list clear kar di gayi hai. 🌸")
+        return
+
+    parts = [w.strip() for w in text.split(",") if w.strip()]
+    await set_user_field(user_id, "remove_words", parts)
+    settings_states.pop(user_id, None)
+    await msg.reply_text(
+        "Remove words list set ho gayi hai:\n" + ", ".join(parts)
+    )
+
+
+# ---------- TEXT ROUTER ----------
+@bot.on_message(
+    (filters.private | filters.group)
+    & ~filters.command(
+        [
+            "start",
+            "help",
+            "status",
             "plan",
             "cancel",
             "logout",
             "settings",
             "login",
             "batch",
+            "resume",
             "addpremium",
             "remove",
             "clear",
@@ -1506,18 +2989,84 @@ async def on_plain_text(client: Client, msg: Message):
 # ===================== main.py (PART 4/4) =====================
 import os  # for file path operations
 
-async def robust_get_message(
+async def fetch_messages_chunk(
+    client: Client,
+    chat_identifier: Any,
+    msg_ids: List[int],
+) -> List[Optional[Message]]:
+    """
+    Ek hi getMessages call me poora id chunk (max FETCH_CHUNK_SIZE) laata hai.
+    Result msg_ids ke order me hota hai; deleted/empty ids ki jagah None.
+    """
+    result = await client.get_messages(chat_identifier, msg_ids)
+    by_id: Dict[int, Message] = {}
+    for m in result or []:
+        if m and not getattr(m, "empty", False):
+            by_id[m.id] = m
+    return [by_id.get(mid) for mid in msg_ids]
+
+
+# ---------- PEER RESOLUTION MEMO ----------
+def client_session_key(client: Client) -> str:
+    """Cache key ke liye client + uske session ki pehchaan."""
+    session_string = getattr(client, "session_string", None) or ""
+    return f"{client.name}:{hash(session_string)}"
+
+
+def input_peer_to_chat_id(peer: Any) -> Optional[int]:
+    if isinstance(peer, raw.types.InputPeerChannel):
+        return int(f"-100{peer.channel_id}")
+    if isinstance(peer, raw.types.InputPeerChat):
+        return -peer.chat_id
+    if isinstance(peer, raw.types.InputPeerUser):
+        return peer.user_id
+    return None
+
+
+async def remember_peer_resolution(u_client: Client, chat_identifier: Any, candidate: Any):
+    """Jo candidate kaam kiya, usko resolved peer ke saath TTL tak yaad rakho."""
+    try:
+        peer = await u_client.resolve_peer(candidate)
+    except Exception:
+        peer = None
+    resolved_id = input_peer_to_chat_id(peer) if peer is not None else None
+    peer_resolution_cache[(client_session_key(u_client), chat_identifier)] = {
+        "candidate": candidate,
+        "peer": peer,
+        "chat_id": resolved_id if resolved_id is not None else candidate,
+        "expires": time.time() + PEER_CACHE_TTL,
+    }
+
+
+def forget_peer_resolution(u_client: Client, chat_identifier: Any):
+    peer_resolution_cache.pop((client_session_key(u_client), chat_identifier), None)
+
+
+async def robust_get_messages(
     u_client: Client,
     chat_identifier: Any,
-    msg_id: int,
-) -> Optional[Message]:
+    msg_ids: List[int],
+) -> List[Optional[Message]]:
     """
-    devgagan ke get_msg ki tarah robust fetch:
+    devgagan ke get_msg ki tarah robust fetch, lekin poore id chunk ke liye:
+    - Pehle peer_resolution_cache dekhta hai (hit = sirf ek fetch call)
     - Public/private dono ke liye multiple chat_id formats try karta hai
     - Dialogs refresh karke old/migrated groups ka access better banata hai
     """
 
     last_exc: Optional[Exception] = None
+    fetched_ok = False
+    ok_candidates: List[Any] = []  # jin candidates pe fetch chala (chahe chunk khali ho)
+
+    cached = peer_resolution_cache.get((client_session_key(u_client), chat_identifier))
+    if cached and cached["expires"] > time.time():
+        try:
+            return await fetch_messages_chunk(u_client, cached["chat_id"], msg_ids)
+        except (PeerIdInvalid, ChannelPrivate):
+            # Access chala gaya / peer badal gaya -> memo hata ke full resolution
+            forget_peer_resolution(u_client, chat_identifier)
+    elif cached:
+        forget_peer_resolution(u_client, chat_identifier)
 
     # dialogs warm-up
     try:
@@ -1570,9 +3119,14 @@ async def robust_get_message(
     # Try all candidates
     for cid in final_candidates:
         try:
-            msg = await u_client.get_messages(cid, msg_id)
-            if msg and not getattr(msg, "empty", False):
-                return msg
+            msgs = await fetch_messages_chunk(u_client, cid, msg_ids)
+            fetched_ok = True
+            ok_candidates.append(cid)
+            if any(msgs):
+                await remember_peer_resolution(u_client, chat_identifier, cid)
+                return msgs
+        except FloodWait:
+            raise
         except Exception as e:
             last_exc = e
             continue
@@ -1581,15 +3135,261 @@ async def robust_get_message(
     try:
         async for _ in u_client.get_dialogs(limit=200):
             break
-        msg = await u_client.get_messages(chat_identifier, msg_id)
-        if msg and not getattr(msg, "empty", False):
-            return msg
+        msgs = await fetch_messages_chunk(u_client, chat_identifier, msg_ids)
+        fetched_ok = True
+        ok_candidates.append(chat_identifier)
+        if any(msgs):
+            await remember_peer_resolution(u_client, chat_identifier, chat_identifier)
+            return msgs
+    except FloodWait:
+        raise
     except Exception as e:
         last_exc = e
 
-    if last_exc:
+    # Chunk sach me khali hai (sab ids deleted) -> None list
+    if last_exc and not fetched_ok:
         raise last_exc
-    return None
+    if ok_candidates:
+        # Sparse range: peer sahi resolve hua tha, agle khali chunks pe warm-up + candidates dobara nahi
+        await remember_peer_resolution(u_client, chat_identifier, ok_candidates[0])
+    return [None] * len(msg_ids)
+
+
+# ---------- CHUNKED FETCH + PREFETCH BUFFER ----------
+SourceItem = Tuple[int, Optional[Message]]
+
+
+class SourceFetchError(Exception):
+    """Source se chunks retries ke baad bhi nahi aaye -> batch checkpoint pe ruke (resume ho sake)."""
+
+
+async def buffer_source_chunks(
+    next_chunk: Callable[[], Awaitable[Optional[List[SourceItem]]]],
+    max_chunks: int = PREFETCH_MAX_CHUNKS,
+) -> AsyncIterator[SourceItem]:
+    """
+    Background task next_chunk() se chunks laata hai aur bounded queue
+    (max_chunks) me daalta hai, taaki send loop ko metadata ka wait na karna
+    pade. next_chunk() None de to source khatam; exception consumer tak
+    SourceFetchError ban ke jaata hai (chup-chaap "khatam" nahi maana jaata).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+
+    async def producer():
+        while True:
+            try:
+                items = await next_chunk()
+            except Exception as e:
+                print(f"[FETCH] chunk error: {e}")
+                await queue.put(e)
+                return
+            if items is None:
+                break
+            await queue.put(items)
+        await queue.put(None)
+
+    producer_task = asyncio.create_task(producer())
+    try:
+        while True:
+            items = await queue.get()
+            if items is None:
+                break
+            if isinstance(items, Exception):
+                raise SourceFetchError(str(items)) from items
+            for item in items:
+                yield item
+    finally:
+        producer_task.cancel()
+
+
+async def prefetch_source_messages(
+    fetch_chunk: Callable[[List[int]], Awaitable[List[Optional[Message]]]],
+    msg_ids: Iterable[int],
+    chunk_size: int = FETCH_CHUNK_SIZE,
+    max_chunks: int = PREFETCH_MAX_CHUNKS,
+) -> AsyncIterator[SourceItem]:
+    """
+    Id range ko chunk_size ke chunks me fetch karta hai (prefetch buffer ke saath).
+    (msg_id, Message | None) order me yield hota hai.
+    """
+    ids_iter = iter(msg_ids)
+
+    async def next_chunk() -> Optional[List[SourceItem]]:
+        chunk = list(itertools.islice(ids_iter, chunk_size))
+        if not chunk:
+            return None
+        try:
+            msgs = await fetch_chunk(chunk)
+        except FloodWait as e:
+            await asyncio.sleep(e.value + 1)
+            try:
+                msgs = await fetch_chunk(chunk)
+            except Exception:
+                msgs = [None] * len(chunk)
+        except Exception:
+            msgs = [None] * len(chunk)
+        return list(zip(chunk, msgs))
+
+    async for item in buffer_source_chunks(next_chunk, max_chunks):
+        yield item
+
+
+# ---------- HISTORY SCAN MODE (sparse channels) ----------
+def resolved_chat_id(client: Client, chat_identifier: Any) -> Any:
+    """peer_resolution_cache me jo candidate kaam kiya tha wo, warna original."""
+    cached = peer_resolution_cache.get((client_session_key(client), chat_identifier))
+    return cached["chat_id"] if cached else chat_identifier
+
+
+async def fetch_history_chunk(
+    client: Client,
+    chat_id: Any,
+    from_msg_id: int,
+    limit: int,
+) -> List[Message]:
+    """
+    from_msg_id se aage (purane -> naye) max `limit` existing messages.
+    Sirf user sessions (bots getHistory nahi kar sakte).
+    """
+    r = await client.invoke(
+        raw.functions.messages.GetHistory(
+            peer=await client.resolve_peer(chat_id),
+            offset_id=from_msg_id,
+            offset_date=0,
+            add_offset=-limit,
+            limit=limit,
+            max_id=0,
+            min_id=from_msg_id - 1,
+            hash=0,
+        )
+    )
+    msgs = await utils.parse_messages(client, r, replies=0)
+    msgs = [m for m in msgs if m and not getattr(m, "empty", False) and m.id >= from_msg_id]
+    return sorted(msgs, key=lambda m: m.id)
+
+
+async def prefetch_history_messages(
+    history_chunk: Callable[[int, int], Awaitable[List[Message]]],
+    from_msg_id: int,
+    limit: int,
+    max_chunks: int = PREFETCH_MAX_CHUNKS,
+) -> AsyncIterator[SourceItem]:
+    """History iterator: sirf existing messages, max `limit`, chat end pe ruk jata hai."""
+    state = {"from_id": from_msg_id, "remaining": limit}
+
+    async def next_chunk() -> Optional[List[SourceItem]]:
+        if state["remaining"] <= 0:
+            return None
+        n = min(HISTORY_CHUNK_SIZE, state["remaining"])
+        for attempt in range(1, HISTORY_CHUNK_RETRIES + 1):
+            try:
+                msgs = await history_chunk(state["from_id"], n)
+                break
+            except FloodWait as e:
+                if attempt == HISTORY_CHUNK_RETRIES:
+                    raise
+                await asyncio.sleep(e.value + 1)
+            except (RPCError, OSError, asyncio.TimeoutError) as e:
+                if attempt == HISTORY_CHUNK_RETRIES:
+                    raise
+                print(f"[FETCH] history chunk failed (attempt {attempt}): {e}")
+                await asyncio.sleep(2 ** attempt)
+        if not msgs:
+            return None
+        msgs = msgs[: state["remaining"]]
+        state["from_id"] = msgs[-1].id + 1
+        state["remaining"] -= len(msgs)
+        return [(m.id, m) for m in msgs]
+
+    async for item in buffer_source_chunks(next_chunk, max_chunks):
+        yield item
+
+
+async def scan_source_messages(
+    fetch_chunk: Callable[[List[int]], Awaitable[List[Optional[Message]]]],
+    start_msg_id: int,
+    count: int,
+    history_chunk: Optional[Callable[[int, int], Awaitable[List[Message]]]] = None,
+    on_history_mode: Optional[Callable[[float], Awaitable[None]]] = None,
+) -> AsyncIterator[SourceItem]:
+    """
+    Pehla chunk id-range se fetch hota hai. Agar usme empty ids ka ratio
+    HISTORY_SCAN_EMPTY_RATIO se zyada hai (aur history_chunk mila hai) to baaki
+    batch history iterator se chalta hai: count = N real messages, gaps free.
+    """
+    first_ids = list(range(start_msg_id, start_msg_id + min(count, FETCH_CHUNK_SIZE)))
+    first = [item async for item in prefetch_source_messages(fetch_chunk, first_ids)]
+    empty_ratio = sum(1 for _, m in first if not m) / len(first) if first else 0.0
+
+    if history_chunk is None or empty_ratio < HISTORY_SCAN_EMPTY_RATIO or len(first) >= count:
+        for item in first:
+            yield item
+        rest = range(start_msg_id + len(first), start_msg_id + count)
+        async for item in prefetch_source_messages(fetch_chunk, rest):
+            yield item
+        return
+
+    if on_history_mode:
+        try:
+            await on_history_mode(empty_ratio)
+        except Exception:
+            pass
+
+    real = [item for item in first if item[1]]
+    for item in real:
+        yield item
+    async for item in prefetch_history_messages(history_chunk, first_ids[-1] + 1, count - len(real)):
+        yield item
+
+
+async def multi_source_messages(
+    fetch_for_chat: Callable[[Any, List[int]], Awaitable[List[Optional[Message]]]],
+    segments: List[BatchSegment],
+    skip: int = 0,
+) -> AsyncIterator[SourceItem]:
+    """
+    Multi-link job ke segments spec order me. Lagataar same-chat segments ke ids
+    ek saath chunk-fetch hote hain (20 bikhre posts = 1 getMessages call).
+    Resume pe pehle `skip` ids (already processed) chhod diye jaate hain.
+    """
+    flat = [
+        (chat, msg_id)
+        for chat, first, last in segments
+        for msg_id in range(first, last + 1)
+    ][skip:]
+    for chat, run in itertools.groupby(flat, key=lambda x: x[0]):
+        ids = [msg_id for _, msg_id in run]
+
+        async def fetch_chunk(chunk: List[int], chat=chat) -> List[Optional[Message]]:
+            return await fetch_for_chat(chat, chunk)
+
+        async for item in prefetch_source_messages(fetch_chunk, ids):
+            yield item
+
+
+async def newest_message_id(client: Client, chat_id: Any) -> int:
+    """Chat ka sabse naya message id – ek hi get_chat_history(limit=1) call."""
+    async for m in client.get_chat_history(chat_id, limit=1):
+        return m.id
+    return 0
+
+
+def batch_span_ids(
+    mode: str,
+    start_msg_id: int,
+    newest_id: int,
+    last_msg_id: Optional[int] = None,
+) -> range:
+    """
+    latest: start -> newest (purane se naye), reverse: newest -> start (naye se
+    purane). Resume pe checkpoint id ke aage/peeche se. Lazy range return hota hai.
+    """
+    if mode == "reverse":
+        first = newest_id if last_msg_id is None else last_msg_id - 1
+        return range(first, start_msg_id - 1, -1)
+    first = start_msg_id if last_msg_id is None else last_msg_id + 1
+    return range(first, newest_id + 1)
+
 
 # ---------- PROGRESS BAR HELPER ----------
 async def update_progress_message(
@@ -1645,7 +3445,14 @@ async def update_batch_header_msg(
     done: int,
     total: int,
     status: str,
+    last_update_holder: Optional[Dict[str, float]] = None,
 ):
+    if last_update_holder is not None:
+        now = time.time()
+        if now - last_update_holder.get("time", 0) < HEADER_UPDATE_INTERVAL:
+            return
+        last_update_holder["time"] = now
+
     text = (
         "💞 SERENA Batch Love Story 💞\n\n"
         f"📎 Source: {link}\n"
@@ -1666,250 +3473,2428 @@ async def update_batch_header_msg(
         pass
 
 
-# ---------- COMMON MEDIA HANDLING (FULL CLONE) ----------
-async def process_one_message(
-    src_client: Client,
-    dest_chat_id: int,
-    src_msg: Message,
-    temp_dir: str,
-    replace_flag: bool,
-    remove_words: List[str],
-    set_chat_id: Optional[int],
-    downloaded_count_ref: List[int],
-    error_count_ref: List[int],
-    media_count_ref: List[int],
+# ---------- FLOOD-AWARE PACER ----------
+class TokenBucket:
+    """Simple token bucket; rate adaptive hai (success pe badhta, FloodWait pe girta)."""
+
+    def __init__(self, rate: float, max_rate: float, burst: int = PACER_BURST):
+        self.rate = min(rate, max_rate)
+        self.max_rate = max_rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Ek token le lo; kitne seconds wait karna hai wo return karta hai."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def speed_up(self):
+        self.rate = min(self.max_rate, self.rate * PACER_SPEEDUP)
+
+    def back_off(self, flood_seconds: float):
+        self.rate = max(PACER_MIN_RATE, self.rate / (2 + flood_seconds / 10))
+        self.blocked_until = max(self.blocked_until, time.monotonic() + flood_seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class FloodPacer:
+    """
+    Har user session aur har destination chat ka alag request budget.
+    - acquire(): dono buckets se token, jo zyada wait bole utna sleep
+    - on_success(): rate dheere dheere upar
+    - on_flood(): FloodWait.value ke hisaab se rate neeche + utni der block
+    """
+
+    def __init__(self):
+        self.session_buckets: Dict[str, TokenBucket] = {}
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+
+    def _session_bucket(self, session_key: str) -> TokenBucket:
+        bucket = self.session_buckets.get(session_key)
+        if bucket is None:
+            bucket = TokenBucket(PACER_SESSION_RATE, PACER_SESSION_MAX_RATE)
+            self.session_buckets[session_key] = bucket
+        return bucket
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            max_rate = PACER_PRIVATE_CHAT_MAX_RATE if chat_id > 0 else PACER_GROUP_CHAT_MAX_RATE
+            bucket = TokenBucket(PACER_CHAT_RATE, max_rate)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def acquire(self, session_key: str, chat_id: int):
+        wait = max(
+            self._session_bucket(session_key).reserve(),
+            self._chat_bucket(chat_id).reserve(),
+        )
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self, session_key: str, chat_id: int):
+        self._session_bucket(session_key).speed_up()
+        self._chat_bucket(chat_id).speed_up()
+
+    def on_flood(self, session_key: str, chat_id: int, flood_seconds: float):
+        self._session_bucket(session_key).back_off(flood_seconds)
+        self._chat_bucket(chat_id).back_off(flood_seconds)
+
+    def current_rate(self, session_key: str, chat_id: int) -> float:
+        """Abhi effective msgs/sec (dono budgets me se jo kam ho)."""
+        return min(self._session_bucket(session_key).rate, self._chat_bucket(chat_id).rate)
+
+
+pacer = FloodPacer()
+
+
+# ---------- FILE_ID CACHE (file_unique_id -> bot file_id) ----------
+file_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0, "inserts": 0}
+file_cache_indexes_ready = False
+
+
+async def ensure_file_cache_indexes():
+    global file_cache_indexes_ready
+    if file_cache_indexes_ready:
+        return
+    file_cache_indexes_ready = True
+    try:
+        await file_cache_coll.create_index("last_used", expireAfterSeconds=FILE_CACHE_TTL)
+    except Exception as e:
+        print(f"[FILE CACHE] index error: {e}")
+
+
+def file_cache_hit_ratio() -> float:
+    total = file_cache_stats["hits"] + file_cache_stats["misses"]
+    return file_cache_stats["hits"] / total if total else 0.0
+
+
+def file_cache_summary() -> str:
+    return (
+        f"file cache: {file_cache_stats['hits']} hits / {file_cache_stats['misses']} misses "
+        f"({file_cache_hit_ratio() * 100:.1f}%)"
+    )
+
+
+async def lookup_cached_file_id(src_msg: Message) -> Optional[str]:
+    """Source file pehle bhej chuke hain to bot wala file_id, warna None."""
+    kind, media = get_message_media(src_msg)
+    if not kind or not getattr(media, "file_unique_id", None) or renamed_pdf_name(src_msg):
+        return None
+    await ensure_file_cache_indexes()
+    try:
+        doc = await file_cache_coll.find_one_and_update(
+            {"_id": media.file_unique_id, "kind": kind},
+            {"$set": {"last_used": datetime.now(timezone.utc)}, "$inc": {"hits": 1}},
+        )
+    except Exception as e:
+        print(f"[FILE CACHE] lookup error: {e}")
+        doc = None
+    if doc and doc.get("file_id"):
+        file_cache_stats["hits"] += 1
+        return doc["file_id"]
+    file_cache_stats["misses"] += 1
+    return None
+
+
+async def remember_file_id(src_msg: Message, sent: Message):
+    """Pehli upload ke baad bot ka file_id source ke file_unique_id pe save karo."""
+    kind, media = get_message_media(src_msg)
+    sent_media = getattr(sent, kind, None) if kind else None
+    if not sent_media or not getattr(media, "file_unique_id", None) or renamed_pdf_name(src_msg):
+        return
+    now = datetime.now(timezone.utc)
+    try:
+        await file_cache_coll.update_one(
+            {"_id": media.file_unique_id},
+            {
+                "$set": {"kind": kind, "file_id": sent_media.file_id, "last_used": now},
+                "$setOnInsert": {"created_at": now, "hits": 0},
+            },
+            upsert=True,
+        )
+        file_cache_stats["inserts"] += 1
+        if file_cache_stats["inserts"] % 100 == 0:
+            await trim_file_cache()
+    except Exception as e:
+        print(f"[FILE CACHE] save error: {e}")
+
+
+async def forget_cached_file_id(src_msg: Message):
+    _, media = get_message_media(src_msg)
+    if not getattr(media, "file_unique_id", None):
+        return
+    try:
+        await file_cache_coll.delete_one({"_id": media.file_unique_id})
+    except Exception:
+        pass
+
+
+async def refetch_source_media(
+    src_client: Client,
+    dest_chat_id: int,
+    src_msg: Message,
+    temp_dir: Optional[str],
+) -> Optional[Union[str, io.BytesIO]]:
+    """
+    Cached file_id stale nikla -> source se fresh download (cache hit ki wajah se
+    downloader ne skip kiya tha). Fail pe None.
+    """
+    if not temp_dir:
+        return None
+    try:
+        async with download_slots:
+            return await download_message_media(src_client, dest_chat_id, src_msg, temp_dir)
+    except Exception as e:
+        print(f"[FILE CACHE] refetch after stale file_id failed: {e}")
+        return None
+
+
+async def trim_file_cache():
+    """LRU eviction: FILE_CACHE_MAX_ENTRIES se upar wale sabse purane entries hatao."""
+    total = await file_cache_coll.estimated_document_count()
+    excess = total - FILE_CACHE_MAX_ENTRIES
+    if excess <= 0:
+        return
+    old_ids = [
+        d["_id"]
+        async for d in file_cache_coll.find({}, {"_id": 1}).sort("last_used", 1).limit(excess)
+    ]
+    if old_ids:
+        await file_cache_coll.delete_many({"_id": {"$in": old_ids}})
+
+
+# ---------- PARALLEL TRANSFER TIMINGS ----------
+class PartTimings:
+    """Parallel transfers ka per-part aur per-file timing (download vs upload throughput)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.parts = 0
+        self.part_bytes = 0
+        self.part_seconds = 0.0
+        self.slowest_part = 0.0
+        self.files = 0
+        self.file_bytes = 0
+        self.file_seconds = 0.0
+
+    def record_part(self, seconds: float, nbytes: int):
+        self.parts += 1
+        self.part_bytes += nbytes
+        self.part_seconds += seconds
+        self.slowest_part = max(self.slowest_part, seconds)
+
+    def record_file(self, seconds: float, nbytes: int):
+        self.files += 1
+        self.file_bytes += nbytes
+        self.file_seconds += seconds
+
+    def summary(self) -> str:
+        if not self.parts:
+            return f"{self.name}: idle"
+        per_part = self.part_seconds / self.parts
+        per_conn = self.part_bytes / max(self.part_seconds, 1e-6)
+        per_file = self.file_bytes / max(self.file_seconds, 1e-6)
+        return (
+            f"{self.name}: {self.files} files @ {humanbytes(per_file)}/s, "
+            f"{self.parts} parts avg {per_part:.2f}s (max {self.slowest_part:.2f}s, "
+            f"{humanbytes(per_conn)}/s per connection)"
+        )
+
+
+transfer_timings = {
+    "download": PartTimings("parallel download"),
+    "upload": PartTimings("parallel upload"),
+}
+
+
+def transfer_timings_summary() -> str:
+    return " | ".join(t.summary() for t in transfer_timings.values())
+
+
+# ---------- PARALLEL CHUNKED DOWNLOAD (upload.getFile, multi-connection) ----------
+# (client_session_key, dc_id) -> started media sessions (har download pe naya Auth mehenga hai)
+media_session_pools: Dict[Tuple[str, int], List[Session]] = {}
+media_session_locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+
+
+async def get_media_sessions(client: Client, dc_id: int, count: int) -> List[Session]:
+    """
+    File ke DC se `count` media connections (reuse hote hain). Dusre DC ke liye
+    ek baar auth key banti hai + authorization import, phir wahi key sab
+    connections share karte hain.
+    """
+    key = (client_session_key(client), dc_id)
+    lock = media_session_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        sessions = media_session_pools.setdefault(key, [])
+        if len(sessions) >= count:
+            return sessions[:count]
+
+        test_mode = await client.storage.test_mode()
+        home_dc = dc_id == await client.storage.dc_id()
+        if sessions:
+            auth_key = sessions[0].auth_key
+        elif home_dc:
+            auth_key = await client.storage.auth_key()
+        else:
+            auth_key = await Auth(client, dc_id, test_mode).create()
+
+        while len(sessions) < count:
+            session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+            await session.start()
+            if not sessions and not home_dc:
+                exported = await client.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+                await session.invoke(
+                    raw.functions.auth.ImportAuthorization(
+                        id=exported.id, bytes=exported.bytes
+                    )
+                )
+            sessions.append(session)
+        return sessions[:count]
+
+
+async def close_media_sessions(client: Client):
+    """Client band/logout hone pe uske media connections bhi band karo."""
+    prefix = client_session_key(client)
+    for key in [k for k in media_session_pools if k[0] == prefix]:
+        for session in media_session_pools.pop(key, []):
+            try:
+                await session.stop()
+            except Exception:
+                pass
+        media_session_locks.pop(key, None)
+
+
+def media_file_location(file_id: FileId) -> Optional[Any]:
+    """Message media ke FileId se InputFileLocation (chat photos yahan nahi aate)."""
+    if file_id.file_type == FileType.CHAT_PHOTO:
+        return None
+    if file_id.file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size,
+        )
+    return raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size,
+    )
+
+
+async def parallel_download_file(
+    client: Client,
+    media: Any,
+    file_path: str,
+    connections: int = PARALLEL_DOWNLOAD_CONNECTIONS,
+    progress: Optional[Callable[[int, int], Awaitable]] = None,
+) -> bool:
+    """
+    Media ko `connections` parallel upload.getFile requests se (har connection
+    apne offsets) preallocated file me likhta hai. CDN redirect / koi error ->
+    False (caller normal download_media pe fallback kare).
+    """
+    total = getattr(media, "file_size", 0) or 0
+    if total <= 0:
+        return False
+    file_id = FileId.decode(media.file_id)
+    location = media_file_location(file_id)
+    if location is None:
+        return False
+
+    n_chunks = (total + DOWNLOAD_CHUNK_SIZE - 1) // DOWNLOAD_CHUNK_SIZE
+    sessions = await get_media_sessions(
+        client, file_id.dc_id, max(1, min(connections, n_chunks))
+    )
+    next_chunk = itertools.count()
+    done_bytes = [0]
+    timings = transfer_timings["download"]
+    started = time.time()
+
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, total)
+
+        async def fetch_worker(session: Session):
+            while True:
+                index = next(next_chunk)
+                if index >= n_chunks:
+                    return
+                offset = index * DOWNLOAD_CHUNK_SIZE
+                t0 = time.time()
+                r = await session.invoke(
+                    raw.functions.upload.GetFile(
+                        location=location,
+                        offset=offset,
+                        limit=DOWNLOAD_CHUNK_SIZE,
+                    ),
+                    sleep_threshold=30,
+                )
+                if not isinstance(r, raw.types.upload.File):
+                    raise RuntimeError("CDN redirect – parallel download unsupported")
+                expected = min(DOWNLOAD_CHUNK_SIZE, total - offset)
+                if len(r.bytes) != expected:
+                    raise RuntimeError(
+                        f"short chunk at {offset}: {len(r.bytes)} != {expected}"
+                    )
+                os.pwrite(fd, r.bytes, offset)
+                timings.record_part(time.time() - t0, len(r.bytes))
+                done_bytes[0] += len(r.bytes)
+                if progress:
+                    await progress(done_bytes[0], total)
+
+        workers = [asyncio.create_task(fetch_worker(s)) for s in sessions]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    except asyncio.CancelledError:
+        os.close(fd)
+        fd = -1
+        os.remove(file_path)
+        raise
+    except Exception as e:
+        print(f"[DEBUG] parallel download failed, fallback to download_media: {e}")
+        os.close(fd)
+        fd = -1
+        os.remove(file_path)
+        return False
+    finally:
+        if fd >= 0:
+            os.close(fd)
+    timings.record_file(time.time() - started, total)
+    return True
+
+
+# ---------- PARALLEL MULTIPART UPLOAD (saveBigFilePart) ----------
+async def parallel_upload_file(
+    client: Client,
+    file_path: str,
+    file_name: str,
+    window: int = PARALLEL_UPLOAD_WINDOW,
+    connections: int = PARALLEL_UPLOAD_CONNECTIONS,
+) -> Any:
+    """
+    Bade file ke saveBigFilePart parts `window` tak ek saath bhejta hai
+    (`connections` media sessions pe baante hue). Fail hua part akela retry hota
+    hai. Success pe raw InputFileBig (send call me seedha jaata hai).
+    """
+    total = os.path.getsize(file_path)
+    total_parts = (total + UPLOAD_PART_SIZE - 1) // UPLOAD_PART_SIZE
+    upload_id = client.rnd_id()
+    sessions = await get_media_sessions(
+        client, await client.storage.dc_id(), max(1, connections)
+    )
+    next_part = itertools.count()
+    timings = transfer_timings["upload"]
+    started = time.time()
+
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+
+        async def upload_worker(session: Session):
+            while True:
+                part = next(next_part)
+                if part >= total_parts:
+                    return
+                chunk = os.pread(fd, UPLOAD_PART_SIZE, part * UPLOAD_PART_SIZE)
+                await save_file_part(session, upload_id, part, total_parts, chunk)
+
+        workers = [
+            asyncio.create_task(upload_worker(sessions[i % len(sessions)]))
+            for i in range(max(1, min(window, total_parts)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+
+    timings.record_file(time.time() - started, total)
+    return raw.types.InputFileBig(id=upload_id, parts=total_parts, name=file_name)
+
+
+async def save_file_part(
+    session: Session,
+    upload_id: int,
+    part: int,
+    total_parts: int,
+    chunk: bytes,
+    big: bool = True,
+):
+    """Ek saveBigFilePart/saveFilePart, apne hi retries ke saath (baaki parts pe asar nahi)."""
+    for attempt in range(1, UPLOAD_PART_RETRIES + 1):
+        t0 = time.time()
+        try:
+            if big:
+                query = raw.functions.upload.SaveBigFilePart(
+                    file_id=upload_id,
+                    file_part=part,
+                    file_total_parts=total_parts,
+                    bytes=chunk,
+                )
+            else:
+                query = raw.functions.upload.SaveFilePart(
+                    file_id=upload_id,
+                    file_part=part,
+                    bytes=chunk,
+                )
+            ok = await session.invoke(query, sleep_threshold=30)
+            if not ok:
+                raise RuntimeError(f"save file part returned false for part {part}")
+            transfer_timings["upload"].record_part(time.time() - t0, len(chunk))
+            return
+        except FloodWait as e:
+            if attempt == UPLOAD_PART_RETRIES:
+                raise
+            await asyncio.sleep(e.value)
+        except (RPCError, OSError, RuntimeError, asyncio.TimeoutError) as e:
+            if attempt == UPLOAD_PART_RETRIES:
+                raise
+            print(f"[DEBUG] upload part {part} failed (attempt {attempt}): {e}")
+            await asyncio.sleep(attempt)
+
+
+# ---------- STREAMING RELAY (stream_media -> ring buffer -> upload parts) ----------
+def can_stream_relay(src_msg: Message) -> bool:
+    """
+    Relay tabhi jab size pata ho aur type raw SendMedia se bhej sakte hain.
+    Parallel download wale bade files relay nahi hote: stream_media ek hi
+    connection hai, disk path pe wo kai connections + parallel upload parts leta hai.
+    """
+    kind, media = get_message_media(src_msg)
+    if kind not in ("photo", "video", "document", "animation", "audio", "voice", "video_note"):
+        return False
+    return (getattr(media, "file_size", 0) or 0) > 0 and not uses_parallel_download(src_msg)
+
+
+def uses_parallel_download(src_msg: Message) -> bool:
+    """Download kai connections (parallel_download_file) se hoga?"""
+    kind, media = get_message_media(src_msg)
+    return (
+        kind != "photo"
+        and (getattr(media, "file_size", 0) or 0) >= PARALLEL_DOWNLOAD_MIN_SIZE
+        and PARALLEL_DOWNLOAD_CONNECTIONS > 1
+    )
+
+
+def relay_file_name(src_msg: Message) -> str:
+    # Disk wale path jaisa hi naam (download "SERENA_" pe hota hai, PDF rename alag)
+    return renamed_pdf_name(src_msg) or "SERENA_"
+
+
+async def relay_media_upload(
+    src_client: Client,
+    src_msg: Message,
+    progress: Optional[Callable[[int, int], Awaitable]] = None,
+    uploader: Client = bot,
+) -> Any:
+    """
+    Source ke stream_media chunks ko 512 KB parts me kaat kar bounded ring buffer
+    (RELAY_BUFFER_PARTS) se uploader bot ke connections pe bhejta hai. Pehla chunk
+    aate hi upload shuru; disk kabhi touch nahi hota. Success pe raw InputFile /
+    InputFileBig (usi uploader ke send_uploaded_media me jaata hai).
+    """
+    _, media = get_message_media(src_msg)
+    total = media.file_size
+    total_parts = (total + UPLOAD_PART_SIZE - 1) // UPLOAD_PART_SIZE
+    big = total > BIG_FILE_THRESHOLD
+    upload_id = uploader.rnd_id()
+    md5_sum = None if big else hashlib.md5()
+    sessions = await get_media_sessions(
+        uploader, await uploader.storage.dc_id(), max(1, PARALLEL_UPLOAD_CONNECTIONS)
+    )
+    ring: asyncio.Queue = asyncio.Queue(maxsize=max(1, RELAY_BUFFER_PARTS))
+    n_workers = max(1, min(PARALLEL_UPLOAD_WINDOW, total_parts))
+    sent_bytes = [0]
+    timings = transfer_timings["upload"]
+    started = time.time()
+
+    async def producer():
+        part = 0
+        pending = bytearray()
+
+        async def push(piece: bytes):
+            nonlocal part
+            if md5_sum:
+                md5_sum.update(piece)
+            await ring.put((part, piece))
+            part += 1
+
+        async for chunk in src_client.stream_media(src_msg):
+            pending += chunk
+            while len(pending) >= UPLOAD_PART_SIZE:
+                await push(bytes(pending[:UPLOAD_PART_SIZE]))
+                del pending[:UPLOAD_PART_SIZE]
+        if pending:
+            await push(bytes(pending))
+        if part != total_parts:
+            raise RuntimeError(f"stream gave {part} parts, expected {total_parts}")
+        for _ in range(n_workers):
+            await ring.put(None)
+
+    async def consumer(session: Session):
+        while True:
+            entry = await ring.get()
+            if entry is None:
+                return
+            part, piece = entry
+            await save_file_part(session, upload_id, part, total_parts, piece, big)
+            sent_bytes[0] += len(piece)
+            if progress:
+                await progress(sent_bytes[0], total)
+
+    tasks = [asyncio.create_task(producer())] + [
+        asyncio.create_task(consumer(sessions[i % len(sessions)]))
+        for i in range(n_workers)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    timings.record_file(time.time() - started, total)
+    name = relay_file_name(src_msg)
+    if big:
+        return raw.types.InputFileBig(id=upload_id, parts=total_parts, name=name)
+    return raw.types.InputFile(
+        id=upload_id, parts=total_parts, name=name, md5_checksum=md5_sum.hexdigest()
+    )
+
+
+async def relay_message_media(
+    src_client: Client,
+    dest_chat_id: int,
+    src_msg: Message,
+    uploader: Client = bot,
+) -> Optional[Any]:
+    """relay_media_upload + progress bar (download_message_media jaisa). Fail pe None."""
+    file_name = media_display_name(src_msg)
+    progress_msg = await bot.send_message(
+        dest_chat_id,
+        f"📥 Downloading\n\n{file_name}\nto my server\n[○○○○○○○○○○○○○○○○○○○○]",
+    )
+    start_time = time.time()
+    last_holder = {"time": 0.0}
+
+    async def progress(current: int, total: int):
+        await update_progress_message(
+            progress_msg, file_name, current, total, start_time, last_holder
+        )
+
+    uploaded = None
+    try:
+        async with uploader_pool.track(uploader, get_message_media(src_msg)[1].file_size):
+            uploaded = await relay_media_upload(src_client, src_msg, progress, uploader)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print(f"[DEBUG] stream relay failed, fallback to disk download: {e}")
+    finally:
+        try:
+            await progress_msg.delete()
+        except Exception:
+            pass
+    return uploaded
+
+
+async def restream_part(
+    src_client: Client,
+    src_msg: Message,
+    input_file: Any,
+    part: int,
+    uploader: Client = bot,
 ):
+    """Relay wale upload ka ek missing part source se dobara stream karke bhejo."""
+    offset = part * UPLOAD_PART_SIZE
+    chunk_index, inner = divmod(offset, DOWNLOAD_CHUNK_SIZE)
+    async for chunk in src_client.stream_media(src_msg, limit=1, offset=chunk_index):
+        piece = chunk[inner:inner + UPLOAD_PART_SIZE]
+        break
+    else:
+        raise RuntimeError(f"part {part} stream nahi hua")
+    sessions = await get_media_sessions(uploader, await uploader.storage.dc_id(), 1)
+    await save_file_part(
+        sessions[0],
+        input_file.id,
+        part,
+        input_file.parts,
+        piece,
+        isinstance(input_file, raw.types.InputFileBig),
+    )
+
+
+# ---------- UPLOADER BOT POOL (helper bot tokens) ----------
+class UploaderPool:
+    """
+    Primary bot + UPLOADER_BOT_TOKENS ke helper bots. Har upload sabse kam busy
+    (in-flight uploads, phir total bytes) aur FloodWait se free bot pe jaata hai.
+    Helper UPLOAD_DUMP_CHAT_ID me bhejta hai, phir primary bot wahan se
+    destination me copy karta hai (file_id primary ka, cache/forward waise hi).
+    """
+
+    def __init__(self, primary: Client):
+        self.clients: List[Client] = [primary]
+        self.active: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+        self.flood_until: Dict[str, float] = {}
+        self._register(primary)
+
+    def _register(self, client: Client):
+        self.active[client.name] = 0
+        self.bytes[client.name] = 0
+        self.flood_until[client.name] = 0.0
+
+    @property
+    def helpers(self) -> List[Client]:
+        return self.clients[1:]
+
+    async def start(self, tokens: List[str], prefix: str = "serena"):
+        # Shard process me primary bot ka naam badal chuka hota hai -> naye naam se register
+        self._register(self.clients[0])
+        if not tokens:
+            return
+        if not UPLOAD_DUMP_CHAT_ID:
+            print("[UPLOADERS] UPLOAD_DUMP_CHAT_ID set nahi, helper bots skip")
+            return
+        for i, token in enumerate(tokens, start=1):
+            client = use_persistent_storage(
+                Client(
+                    f"{prefix}_uploader_{i}",
+                    api_id=API_ID,
+                    api_hash=API_HASH,
+                    bot_token=token,
+                    in_memory=True,
+                    no_updates=True,
+                )
+            )
+            try:
+                await client.start()
+                # Dump chat ka peer pehle se resolve (pehli upload pe PEER_ID_INVALID na aaye)
+                await client.get_chat(UPLOAD_DUMP_CHAT_ID)
+            except Exception as e:
+                print(f"[UPLOADERS] helper {i} start nahi hua: {e}")
+                await stop_user_client(client)
+                continue
+            self.clients.append(client)
+            self._register(client)
+        print(f"[UPLOADERS] {len(self.helpers)} helper bots ready")
+
+    async def stop(self):
+        helpers, self.clients = self.helpers, self.clients[:1]
+        for client in helpers:
+            await stop_user_client(client)
+
+    def pick(self) -> Client:
+        """Sabse kam load wala bot; sab flood me hon to jo sabse pehle free ho."""
+        now = time.time()
+        free = [c for c in self.clients if self.flood_until[c.name] <= now]
+        if not free:
+            return min(self.clients, key=lambda c: self.flood_until[c.name])
+        return min(free, key=lambda c: (self.active[c.name], self.bytes[c.name]))
+
+    def on_flood(self, client: Client, seconds: float):
+        self.flood_until[client.name] = max(self.flood_until[client.name], time.time() + seconds)
+
+    @contextlib.asynccontextmanager
+    async def track(self, client: Client, size: int):
+        self.active[client.name] += 1
+        try:
+            yield
+        finally:
+            self.active[client.name] -= 1
+            self.bytes[client.name] += size or 0
+
+    def summary(self) -> str:
+        now = time.time()
+        parts = [
+            f"{c.name}: {self.active[c.name]} active, {humanbytes(self.bytes[c.name])}"
+            + (" (flood)" if self.flood_until[c.name] > now else "")
+            for c in self.clients
+        ]
+        return "uploaders: " + "; ".join(parts)
+
+
+uploader_pool = UploaderPool(bot)
+
+
+async def send_via_uploader(
+    uploader: Client,
+    dest_chat_id: int,
+    send: Callable[[Client, int], Awaitable[Any]],
+) -> Any:
+    """
+    send(client, chat_id) uploader se chalao. Helper ho to dump chat me bhej kar
+    primary bot destination me copy karta hai (album ho to copy_media_group).
+    Kisi bhi bot (primary bhi) ka FloodWait pool me note hota hai aur upar jaata hai.
+    """
+    if uploader is bot:
+        try:
+            return await send(bot, dest_chat_id)
+        except FloodWait as e:
+            uploader_pool.on_flood(bot, e.value)
+            raise
+    try:
+        dumped = await send(uploader, UPLOAD_DUMP_CHAT_ID)
+    except FloodWait as e:
+        uploader_pool.on_flood(uploader, e.value)
+        raise
+    if not dumped:
+        return dumped
+    try:
+        if isinstance(dumped, list):
+            return await bot.copy_media_group(dest_chat_id, UPLOAD_DUMP_CHAT_ID, dumped[0].id)
+        return await bot.copy_message(dest_chat_id, UPLOAD_DUMP_CHAT_ID, dumped.id)
+    except FloodWait as e:
+        uploader_pool.on_flood(bot, e.value)
+        raise
+    finally:
+        ids = [m.id for m in dumped] if isinstance(dumped, list) else [dumped.id]
+        cleanup = asyncio.create_task(delete_dump_messages(uploader, ids))
+        dump_cleanup_tasks.add(cleanup)
+        cleanup.add_done_callback(dump_cleanup_tasks.discard)
+
+
+dump_cleanup_tasks: set = set()  # dump chat deletes (reference na ho to GC task ko kha sakta hai)
+
+
+async def delete_dump_messages(uploader: Client, message_ids: List[int]):
+    try:
+        await uploader.delete_messages(UPLOAD_DUMP_CHAT_ID, message_ids)
+    except Exception:
+        pass
+
+
+# ---------- TEMP STORAGE (tmpfs/disk, quotas, orphan sweep) ----------
+# Har process ka tag batch dirs ke naam me: restart ke baad purane dirs pehchaan me aate hain
+TEMP_RUN_TAG = f"{os.getpid()}x{int(time.time())}"
+TEMP_DIR_RE = re.compile(r"^serena_.*_r(\d+)x(\d+)_")
+
+
+class TempStorage:
+    """
+    Batch temp dirs ka manager:
+    - har file ke size se tmpfs (RAM) ya disk dir chunta hai
+    - per-user aur global byte quota; bhara ho to reserve() wait karta hai
+    - startup pe pichle (mare hue) processes ke serena_* dirs saaf
+    - current usage report
+    """
+
+    def __init__(self, user_quota: int, global_quota: int):
+        self.user_quota = user_quota
+        self.global_quota = global_quota
+        self.used = 0
+        self.user_used: Dict[int, int] = {}
+        self.dir_owner: Dict[str, int] = {}              # batch temp_dir -> user_id
+        self.reservations: Dict[str, Tuple[int, int]] = {}  # path -> (user_id, bytes)
+        self.waiters: List[asyncio.Future] = []
+
+    # --- batch dirs ---
+    def create_batch_dir(self, user_id: int, prefix: str) -> str:
+        temp_dir = tempfile.mkdtemp(prefix=f"{prefix}r{TEMP_RUN_TAG}_", dir=TEMP_ROOT)
+        self.dir_owner[temp_dir] = user_id
+        return temp_dir
+
+    def tmpfs_dir(self, temp_dir: str) -> str:
+        return os.path.join(TMPFS_DIR, os.path.basename(temp_dir))
+
+    def pick_dir(self, temp_dir: str, size: int) -> str:
+        """Chhota file aur tmpfs me jagah -> tmpfs, warna disk wala temp_dir."""
+        if not size or size > TMPFS_MAX_FILE_SIZE or not os.path.isdir(TMPFS_DIR):
+            return temp_dir
+        try:
+            if shutil.disk_usage(TMPFS_DIR).free < size + TMPFS_MIN_FREE:
+                return temp_dir
+            shm_dir = self.tmpfs_dir(temp_dir)
+            os.makedirs(shm_dir, exist_ok=True)
+            return shm_dir
+        except OSError:
+            return temp_dir
+
+    def remove_batch_dir(self, temp_dir: str):
+        """Worker ke finally me: dono dirs hatao + bachi reservations chhodo."""
+        shm_dir = self.tmpfs_dir(temp_dir)
+        for path in [p for p in self.reservations if p.startswith((temp_dir, shm_dir))]:
+            self.release(path)
+        self.dir_owner.pop(temp_dir, None)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        shutil.rmtree(shm_dir, ignore_errors=True)
+
+    # --- quotas ---
+    def _fits(self, user_id: int, nbytes: int) -> bool:
+        user_used = self.user_used.get(user_id, 0)
+        # Quota se bada akela file bhi chal jaye (warna hamesha wait karta)
+        if user_used and user_used + nbytes > self.user_quota:
+            return False
+        return not self.used or self.used + nbytes <= self.global_quota
+
+    async def reserve(self, temp_dir: str, path: str, nbytes: int):
+        """`path` ke liye bytes reserve; quota bhara ho to release hone tak wait."""
+        user_id = self.dir_owner.get(temp_dir, 0)
+        while not self._fits(user_id, nbytes):
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        self.used += nbytes
+        self.user_used[user_id] = self.user_used.get(user_id, 0) + nbytes
+        self.reservations[path] = (user_id, nbytes)
+
+    def release(self, path: str):
+        user_id, nbytes = self.reservations.pop(path, (None, 0))
+        if user_id is None:
+            return
+        self.used -= nbytes
+        left = self.user_used.get(user_id, 0) - nbytes
+        if left > 0:
+            self.user_used[user_id] = left
+        else:
+            self.user_used.pop(user_id, None)
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    # --- orphans + usage ---
+    def sweep_orphans(self) -> int:
+        """Jo serena_* dirs kisi zinda process ke nahi hain (SIGKILL/crash leftovers) unhe hatao."""
+        removed = 0
+        for root in (TEMP_ROOT, TMPFS_DIR):
+            try:
+                names = os.listdir(root)
+            except OSError:
+                continue
+            for name in names:
+                if not name.startswith("serena_"):
+                    continue
+                m = TEMP_DIR_RE.match(name)
+                if m and f"{m.group(1)}x{m.group(2)}" == TEMP_RUN_TAG:
+                    continue
+                if m and int(m.group(1)) != os.getpid() and pid_alive(int(m.group(1))):
+                    continue  # doosre worker process ka
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def user_usage(self, user_id: int) -> int:
+        return self.user_used.get(user_id, 0)
+
+    def summary(self) -> str:
+        text = (
+            f"temp storage: {humanbytes(self.used)} / {humanbytes(self.global_quota)} reserved, "
+            f"{len(self.dir_owner)} batch dirs, {len(self.waiters)} waiting"
+        )
+        try:
+            text += f", disk free {humanbytes(shutil.disk_usage(TEMP_ROOT).free)}"
+            if os.path.isdir(TMPFS_DIR):
+                text += f", tmpfs free {humanbytes(shutil.disk_usage(TMPFS_DIR).free)}"
+        except OSError:
+            pass
+        return text
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+temp_storage = TempStorage(TEMP_USER_QUOTA, TEMP_GLOBAL_QUOTA)
+
+
+# ---------- IN-MEMORY SMALL MEDIA (BytesIO pool) ----------
+class MemoryBufferPool:
     """
-    Har message ko clone karta hai dest_chat_id me:
-    - TEXT + links as text
-    - PHOTO as photo (fallback doc if PHOTO_EXT_INVALID)
-    - VIDEO as video
-    - DOCUMENT as document (PDF filename + ' Serena')
-    - ANIMATION as gif
-    - STICKER as sticker
-    - AUDIO/VOICE/VIDEO_NOTE as unke type me
+    Chhote media ke liye reusable BytesIO buffers. Sab buffers mila kar
+    `cap_bytes` se zyada reserve nahi hote – cap bhara ho to try_acquire None
+    deta hai (caller disk pe download kare). Wait nahi karte: buffer send ke
+    baad (sequence order me) free hota hai, to head item ka wait deadlock ban sakta hai.
     """
 
+    def __init__(self, cap_bytes: int):
+        self.cap = cap_bytes
+        self.used = 0
+        self.free: List[io.BytesIO] = []
+
+    def try_acquire(self, size: int) -> Optional[io.BytesIO]:
+        if self.used + size > self.cap:
+            return None
+        self.used += size
+        buf = self.free.pop() if self.free else io.BytesIO()
+        buf.reserved = size
+        return buf
+
+    def release(self, buf: io.BytesIO):
+        self.used -= getattr(buf, "reserved", 0)
+        buf.reserved = 0
+        buf.seek(0)
+        buf.truncate()
+        if len(self.free) < IN_MEMORY_POOL_BUFFERS:
+            self.free.append(buf)
+
+    def summary(self) -> str:
+        return f"memory pool: {humanbytes(self.used)} / {humanbytes(self.cap)} in use"
+
+
+memory_pool = MemoryBufferPool(IN_MEMORY_POOL_BYTES)
+
+
+def fits_in_memory(src_msg: Message) -> bool:
+    size = getattr(get_message_media(src_msg)[1], "file_size", 0) or 0
+    return 0 < size <= IN_MEMORY_MAX_SIZE
+
+
+async def download_to_buffer(src_client: Client, src_msg: Message) -> Optional[io.BytesIO]:
+    """Chhota media pool ke BytesIO me stream karo (disk nahi). Pool bhara / fail pe None."""
+    size = get_message_media(src_msg)[1].file_size
+    buf = memory_pool.try_acquire(size)
+    if buf is None:
+        return None
+    try:
+        async for chunk in src_client.stream_media(src_msg):
+            buf.write(chunk)
+        if buf.tell() != size:
+            raise RuntimeError(f"got {buf.tell()} bytes, expected {size}")
+    except asyncio.CancelledError:
+        memory_pool.release(buf)
+        raise
+    except Exception as e:
+        print(f"[DEBUG] in-memory download failed, fallback to disk: {e}")
+        memory_pool.release(buf)
+        return None
+    buf.seek(0)
+    buf.name = "SERENA_"  # disk download jaisa naam
+    return buf
+
+
+# ---------- COMMON MEDIA HANDLING (FULL CLONE) ----------
+
+def build_clone_text(src_msg: Message, replace_flag: bool, remove_words: List[str]) -> str:
     text = src_msg.text or src_msg.caption or ""
     text = replace_serena_text(text, replace_flag)
     text = apply_remove_words(text, remove_words)
     if not text:
         text = "(empty message)"
+    return text
 
-    sent_msgs: List[Message] = []
 
-    has_media = any(
-        [
-            bool(src_msg.photo),
-            bool(src_msg.video),
-            bool(src_msg.document),
-            bool(src_msg.animation),
-            bool(src_msg.sticker),
-            bool(src_msg.audio),
-            bool(src_msg.voice),
-            bool(src_msg.video_note),
-        ]
+MEDIA_KINDS = ("photo", "video", "document", "animation", "audio", "sticker", "voice", "video_note")
+
+
+def get_message_media(src_msg: Message) -> Tuple[Optional[str], Any]:
+    """(kind, media object) jaise ('video', Video); media na ho to (None, None)."""
+    for kind in MEDIA_KINDS:
+        media = getattr(src_msg, kind, None)
+        if media:
+            return kind, media
+    return None, None
+
+
+def message_has_media(src_msg: Message) -> bool:
+    return get_message_media(src_msg)[0] is not None
+
+
+def media_display_name(src_msg: Message) -> str:
+    # File name guess (sirf progress text ke liye)
+    if src_msg.document and src_msg.document.file_name:
+        return src_msg.document.file_name
+    if src_msg.video and src_msg.video.file_name:
+        return src_msg.video.file_name
+    if src_msg.audio and src_msg.audio.file_name:
+        return src_msg.audio.file_name
+    return "Media file"
+
+
+async def download_message_media(
+    src_client: Client,
+    dest_chat_id: int,
+    src_msg: Message,
+    temp_dir: str,
+) -> Optional[Union[str, io.BytesIO]]:
+    """
+    Media ko temp_dir me download karta hai (dest chat me progress bar ke saath).
+    Chhota media (IN_MEMORY_MAX_SIZE tak) seedha pool ke BytesIO me aata hai.
+    Success pe file path / buffer, warna None.
+    """
+    if fits_in_memory(src_msg):
+        buf = await download_to_buffer(src_client, src_msg)
+        if buf:
+            return buf
+
+    file_name = media_display_name(src_msg)
+
+    progress_msg = await bot.send_message(
+        dest_chat_id,
+        f"📥 Downloading\n\n{file_name}\nto my server\n[○○○○○○○○○○○○○○○○○○○○]",
+    )
+
+    start_time = time.time()
+    last_holder = {"time": 0.0}
+
+    def progress(current: int, total: int):
+        # Thread-safe progress update
+        try:
+            asyncio.run_coroutine_threadsafe(
+                update_progress_message(
+                    progress_msg,
+                    file_name,
+                    current,
+                    total,
+                    start_time,
+                    last_holder,
+                ),
+                bot.loop,
+            )
+        except Exception:
+            pass
+
+    async def parallel_progress(current: int, total: int):
+        await update_progress_message(
+            progress_msg, file_name, current, total, start_time, last_holder
+        )
+
+    # Har download ka apna folder, taaki parallel downloads ek hi "SERENA_" path na likhein.
+    # Chhota file tmpfs pe, bada disk pe; quota bhara ho to yahin wait.
+    kind, media = get_message_media(src_msg)
+    expected_size = getattr(media, "file_size", 0) or 0
+    dl_dir = tempfile.mkdtemp(prefix="dl_", dir=temp_storage.pick_dir(temp_dir, expected_size))
+    await temp_storage.reserve(temp_dir, dl_dir, expected_size)
+    file_path = None
+    if uses_parallel_download(src_msg):
+        # Bada file: kai connections se alag-alag offsets parallel
+        parallel_path = os.path.join(dl_dir, "SERENA_")
+        try:
+            if await parallel_download_file(
+                src_client, media, parallel_path, progress=parallel_progress
+            ):
+                file_path = parallel_path
+        except asyncio.CancelledError:
+            temp_storage.release(dl_dir)
+            shutil.rmtree(dl_dir, ignore_errors=True)
+            raise
+        except Exception as e:
+            print(f"[DEBUG] parallel download setup failed: {e}")
+
+    try:
+        if not file_path:
+            dl_base = os.path.join(dl_dir, "SERENA_")
+            file_path = await src_client.download_media(
+                src_msg, file_name=dl_base, progress=progress
+            )
+    except Exception:
+        file_path = None
+
+    if not file_path or not os.path.exists(file_path) or not os.path.isfile(file_path):
+        file_path = None
+        temp_storage.release(dl_dir)
+        shutil.rmtree(dl_dir, ignore_errors=True)
+    else:
+        # Final 100% update (best-effort)
+        try:
+            size = os.path.getsize(file_path)
+            await update_progress_message(
+                progress_msg,
+                file_name,
+                size,
+                size,
+                start_time,
+                {"time": 0.0},
+            )
+        except Exception:
+            pass
+
+    try:
+        await progress_msg.delete()
+    except Exception:
+        pass
+
+    return file_path
+
+
+def remove_download(file_path: Optional[Union[str, io.BytesIO]]):
+    """Downloaded file + uska per-download folder hatao (buffer ho to pool me wapas)."""
+    if not file_path:
+        return
+    if isinstance(file_path, io.BytesIO):
+        memory_pool.release(file_path)
+        return
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+    dl_dir = os.path.dirname(file_path)
+    if os.path.basename(dl_dir).startswith("dl_"):
+        temp_storage.release(dl_dir)
+        try:
+            os.rmdir(dl_dir)
+        except OSError:
+            pass
+
+
+def local_file_size(file_path: Optional[Union[str, io.BytesIO]]) -> int:
+    if not file_path:
+        return 0
+    if isinstance(file_path, io.BytesIO):
+        return file_path.getbuffer().nbytes
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def renamed_pdf_name(src_msg: Message) -> Optional[str]:
+    # PDF ke liye filename change
+    if src_msg.document and src_msg.document.file_name:
+        orig = src_msg.document.file_name
+        name, ext = os.path.splitext(orig)
+        if ext.lower() == ".pdf":
+            return f"{name} Serena{ext}"
+    return None
+
+
+def can_copy_server_side(src_msg: Message) -> bool:
+    """
+    Bot khud source padh sakta hai aur content protected nahi hai ->
+    copy (file_id se) ho sakta hai, koi byte server se nahi guzarta.
+    PDF rename ke liye file chahiye, isliye wo download path pe hi rehta hai.
+    """
+    if src_msg.has_protected_content:
+        return False
+    if src_msg.chat and src_msg.chat.has_protected_content:
+        return False
+    return message_has_media(src_msg) and renamed_pdf_name(src_msg) is None
+
+
+async def copy_source_media(
+    dest_chat_id: int,
+    src_msg: Message,
+    text: str,
+) -> Optional[Message]:
+    """Server-side copy: media file_id se dobara bhejo, caption hamara wala."""
+    caption = text if text != "(empty message)" else ""
+    return await src_msg.copy(dest_chat_id, caption=caption)
+
+
+def uploaded_input_media(src_msg: Message, input_file: Any, file_name: str) -> Optional[Any]:
+    """
+    Source ke type/metadata se raw InputMediaUploaded* (photo/video/document/
+    animation/audio/voice/video_note). Sticker jaise baaki types -> None.
+    """
+    kind, media = get_message_media(src_msg)
+    if kind == "photo":
+        return raw.types.InputMediaUploadedPhoto(file=input_file)
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if kind == "video":
+        mime_type = media.mime_type or "video/mp4"
+        attributes.append(
+            raw.types.DocumentAttributeVideo(
+                duration=media.duration or 0,
+                w=media.width or 0,
+                h=media.height or 0,
+                supports_streaming=media.supports_streaming or None,
+            )
+        )
+    elif kind == "animation":
+        mime_type = media.mime_type or "video/mp4"
+        attributes.append(
+            raw.types.DocumentAttributeVideo(
+                duration=media.duration or 0,
+                w=media.width or 0,
+                h=media.height or 0,
+            )
+        )
+        attributes.append(raw.types.DocumentAttributeAnimated())
+    elif kind == "audio":
+        mime_type = media.mime_type or "audio/mpeg"
+        attributes.append(
+            raw.types.DocumentAttributeAudio(
+                duration=media.duration or 0,
+                performer=media.performer,
+                title=media.title,
+            )
+        )
+    elif kind == "voice":
+        mime_type = media.mime_type or "audio/ogg"
+        attributes.append(
+            raw.types.DocumentAttributeAudio(duration=media.duration or 0, voice=True)
+        )
+    elif kind == "video_note":
+        mime_type = media.mime_type or "video/mp4"
+        attributes.append(
+            raw.types.DocumentAttributeVideo(
+                duration=media.duration or 0,
+                w=media.length or 0,
+                h=media.length or 0,
+                round_message=True,
+            )
+        )
+    elif kind == "document":
+        mime_type = media.mime_type or "application/zip"
+    else:
+        return None
+    return raw.types.InputMediaUploadedDocument(
+        mime_type=mime_type,
+        file=input_file,
+        attributes=attributes,
+    )
+
+
+async def send_uploaded_media(
+    dest_chat_id: int,
+    src_msg: Message,
+    input_file: Any,
+    caption: Optional[str],
+    file_name: str,
+    reupload_part: Callable[[int], Awaitable[None]],
+    client: Client = bot,
+) -> Optional[Message]:
+    """
+    Pehle se upload hua InputFile raw SendMedia se bhejta hai (usi client se jisne
+    upload kiya). FILE_PART_X_MISSING pe sirf wahi part reupload_part(x) se
+    dobara jaata hai.
+    """
+    media = uploaded_input_media(src_msg, input_file, file_name)
+    if media is None:
+        return None
+
+    peer = await client.resolve_peer(dest_chat_id)
+    for _ in range(UPLOAD_PART_RETRIES + 1):
+        try:
+            r = await client.invoke(
+                raw.functions.messages.SendMedia(
+                    peer=peer,
+                    media=media,
+                    random_id=client.rnd_id(),
+                    **await utils.parse_text_entities(client, caption or "", None, None),
+                )
+            )
+            break
+        except FilePartMissing as e:
+            await reupload_part(e.value)
+    else:
+        return None
+
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client,
+                update.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats},
+            )
+    return None
+
+
+async def send_big_media_file(
+    dest_chat_id: int,
+    src_msg: Message,
+    file_path: str,
+    caption: Optional[str],
+    file_name: str,
+    client: Client = bot,
+) -> Optional[Message]:
+    """
+    Bada file parallel saveBigFilePart se upload karke raw SendMedia se bhejta hai.
+    Type support na ho to None (caller normal send_* use kare).
+    """
+    if uploaded_input_media(src_msg, None, file_name) is None:
+        return None
+    input_file = await parallel_upload_file(client, file_path, file_name)
+
+    async def reupload_part(part: int):
+        sessions = await get_media_sessions(client, await client.storage.dc_id(), 1)
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            chunk = os.pread(fd, UPLOAD_PART_SIZE, part * UPLOAD_PART_SIZE)
+        finally:
+            os.close(fd)
+        await save_file_part(sessions[0], input_file.id, part, input_file.parts, chunk)
+
+    return await send_uploaded_media(
+        dest_chat_id, src_msg, input_file, caption, file_name, reupload_part, client
+    )
+
+
+async def send_media_file(
+    dest_chat_id: int,
+    src_msg: Message,
+    file_path: Union[str, io.BytesIO],
+    text: str,
+    client: Client = bot,
+) -> Optional[Message]:
+    """Downloaded file (path / in-memory buffer / file_id) ko uske asli type ke saath bhejta hai."""
+    caption = text if text != "(empty message)" else None
+    pdf_name = renamed_pdf_name(src_msg)
+
+    if (
+        (src_msg.video or src_msg.document or src_msg.animation or src_msg.audio)
+        and PARALLEL_UPLOAD_CONNECTIONS > 0
+        and local_file_size(file_path) >= PARALLEL_UPLOAD_MIN_SIZE
+    ):
+        try:
+            sent = await send_big_media_file(
+                dest_chat_id,
+                src_msg,
+                file_path,
+                caption,
+                pdf_name or os.path.basename(file_path),
+                client,
+            )
+            if sent:
+                return sent
+        except FloodWait:
+            raise
+        except Exception as e:
+            print(f"[DEBUG] parallel upload failed, fallback to normal send: {e}")
+
+    if src_msg.photo:
+        try:
+            return await client.send_photo(
+                chat_id=dest_chat_id,
+                photo=file_path,
+                caption=caption,
+            )
+        except RPCError as e:
+            if "PHOTO_EXT_INVALID" in str(e):
+                return await client.send_document(
+                    chat_id=dest_chat_id,
+                    document=file_path,
+                    caption=caption,
+                )
+            raise
+
+    if src_msg.video:
+        return await client.send_video(
+            chat_id=dest_chat_id,
+            video=file_path,
+            caption=caption,
+        )
+
+    if src_msg.document:
+        extra_kwargs = {}
+        if pdf_name:
+            extra_kwargs["file_name"] = pdf_name
+        return await client.send_document(
+            chat_id=dest_chat_id,
+            document=file_path,
+            caption=caption,
+            **extra_kwargs,
+        )
+
+    if src_msg.animation:
+        return await client.send_animation(
+            chat_id=dest_chat_id,
+            animation=file_path,
+            caption=caption,
+        )
+
+    if src_msg.audio:
+        return await client.send_audio(
+            chat_id=dest_chat_id,
+            audio=file_path,
+            caption=caption,
+        )
+
+    if src_msg.sticker:
+        return await client.send_sticker(
+            chat_id=dest_chat_id,
+            sticker=file_path,
+        )
+
+    if src_msg.voice:
+        return await client.send_voice(
+            chat_id=dest_chat_id,
+            voice=file_path,
+        )
+
+    if src_msg.video_note:
+        return await client.send_video_note(
+            chat_id=dest_chat_id,
+            video_note=file_path,
+        )
+
+    return None
+
+
+async def send_cloned_message(
+    src_client: Client,
+    dest_chat_id: int,
+    src_msg: Message,
+    text: str,
+    file_path: Optional[Union[str, io.BytesIO]],
+    set_chat_id: Optional[int],
+    downloaded_count_ref: List[int],
+    error_count_ref: List[int],
+    copy_media: bool = False,
+    cached_file_id: Optional[str] = None,
+    uploaded_file: Optional[Any] = None,
+    uploader: Client = bot,
+    temp_dir: Optional[str] = None,
+):
+    """
+    Clone ka send step: pacer token -> send (copy / cached file_id / relayed
+    upload / media / text) -> set_chat + logs forward. FloodWait pacer ko report
+    hota hai aur pacer ka back-off wait karke send SEND_FLOOD_RETRIES baar tak
+    dobara hota hai; file_path send ke baad delete. Nayi upload ka file_id file
+    cache me jata hai. Cached file_id stale ho to source se temp_dir me fresh
+    download karke bhejta hai. Relayed upload usi `uploader` se bheja jaata hai
+    jisne upload kiya; disk/buffer wali file ke liye uploader pool se chuna jaata hai.
+    """
+    session_key = client_session_key(src_client)
+
+    async def send_once() -> Optional[Message]:
+        nonlocal cached_file_id, file_path
+        if copy_media:
+            return await copy_source_media(dest_chat_id, src_msg, text)
+        if cached_file_id:
+            try:
+                return await send_media_file(dest_chat_id, src_msg, cached_file_id, text)
+            except FloodWait:
+                raise
+            except RPCError:
+                # file_id ab valid nahi -> cache se hatao, source se fresh download + upload
+                await forget_cached_file_id(src_msg)
+                cached_file_id = None
+                file_path = await refetch_source_media(
+                    src_client, dest_chat_id, src_msg, temp_dir
+                )
+                if not file_path:
+                    return None
+        if uploaded_file:
+            caption = text if text != "(empty message)" else None
+
+            async def reupload_part(part: int):
+                await restream_part(src_client, src_msg, uploaded_file, part, uploader)
+
+            sent = await send_via_uploader(
+                uploader,
+                dest_chat_id,
+                lambda client, chat_id: send_uploaded_media(
+                    chat_id,
+                    src_msg,
+                    uploaded_file,
+                    caption,
+                    relay_file_name(src_msg),
+                    reupload_part,
+                    client,
+                ),
+            )
+        elif file_path:
+            file_uploader = uploader_pool.pick()
+            async with uploader_pool.track(file_uploader, local_file_size(file_path)):
+                sent = await send_via_uploader(
+                    file_uploader,
+                    dest_chat_id,
+                    lambda client, chat_id: send_media_file(
+                        chat_id, src_msg, file_path, text, client
+                    ),
+                )
+        else:
+            return await bot.send_message(dest_chat_id, text)
+        if sent:
+            await remember_file_id(src_msg, sent)
+        return sent
+
+    sent = None
+    try:
+        for _ in range(SEND_FLOOD_RETRIES + 1):
+            # FloodWait ke baad acquire khud block/back-off tak rukta hai
+            await pacer.acquire(session_key, dest_chat_id)
+            try:
+                sent = await send_once()
+                break
+            except FloodWait as e:
+                pacer.on_flood(session_key, dest_chat_id, e.value)
+    except RPCError:
+        pass
+    finally:
+        remove_download(file_path)
+
+    if not sent:
+        error_count_ref[0] += 1
+        return
+
+    downloaded_count_ref[0] += 1
+    pacer.on_success(session_key, dest_chat_id)
+
+    if set_chat_id:
+        try:
+            await bot.forward_messages(
+                chat_id=set_chat_id,
+                from_chat_id=dest_chat_id,
+                message_ids=sent.id,
+            )
+        except RPCError:
+            pass
+    try:
+        await bot.forward_messages(
+            chat_id=LOGS_CHANNEL_ID,
+            from_chat_id=dest_chat_id,
+            message_ids=sent.id,
+        )
+    except RPCError:
+        pass
+
+
+# ---------- ALBUMS (media_group_id) ----------
+ALBUM_MEDIA_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+
+
+async def send_cloned_album(
+    src_client: Client,
+    dest_chat_id: int,
+    parts: List[Dict[str, Any]],
+    replace_flag: bool,
+    remove_words: List[str],
+    set_chat_id: Optional[int],
+    downloaded_count_ref: List[int],
+    error_count_ref: List[int],
+    temp_dir: Optional[str] = None,
+):
+    """
+    Album ke members (prepared parts) ko ek hi send_media_group call me bhejta hai:
+    ek pacer token, ek send, ek forward (FloodWait pe pacer wait karke dobara,
+    SEND_FLOOD_RETRIES tak). Har part copy / cached file_id / downloaded file me
+    se kuch bhi ho sakta hai; stale cached file_ids ek baar source se dobara
+    download hokar album phir se jaata hai.
+    """
+    kinds = [get_message_media(p["msg"])[0] for p in parts]
+    if len(parts) < 2 or any(k not in ALBUM_MEDIA_TYPES for k in kinds):
+        for p in parts:
+            await send_cloned_message(
+                src_client,
+                dest_chat_id,
+                p["msg"],
+                build_clone_text(p["msg"], replace_flag, remove_words),
+                p["file_path"],
+                set_chat_id,
+                downloaded_count_ref,
+                error_count_ref,
+                copy_media=p.get("copy", False),
+                cached_file_id=p.get("cached_file_id"),
+                temp_dir=temp_dir,
+            )
+        return
+
+    session_key = client_session_key(src_client)
+
+    async def send_group_once() -> List[Message]:
+        media = []
+        for p, kind in zip(parts, kinds):
+            src_msg = p["msg"]
+            text = build_clone_text(src_msg, replace_flag, remove_words)
+            caption = text if text != "(empty message)" else ""
+            if p.get("copy"):
+                ref = getattr(src_msg, kind).file_id
+            elif p.get("cached_file_id"):
+                ref = p["cached_file_id"]
+            else:
+                ref = p["file_path"]
+                # Album me file_name param nahi hota, isliye PDF ko disk pe hi rename karo
+                pdf_name = renamed_pdf_name(src_msg)
+                if pdf_name and isinstance(ref, io.BytesIO):
+                    ref.name = pdf_name
+                elif pdf_name:
+                    new_path = os.path.join(os.path.dirname(ref), pdf_name)
+                    os.replace(ref, new_path)
+                    ref = p["file_path"] = new_path
+            media.append(ALBUM_MEDIA_TYPES[kind](ref, caption=caption))
+
+        uploads = [p for p in parts if p["file_path"]]
+        # Copy/cached file_ids primary bot ke hain -> tab sirf primary bheje
+        uploader = uploader_pool.pick() if len(uploads) == len(parts) else bot
+        size = sum(local_file_size(p["file_path"]) for p in uploads)
+        async with uploader_pool.track(uploader, size):
+            return await send_via_uploader(
+                uploader,
+                dest_chat_id,
+                lambda client, chat_id: client.send_media_group(chat_id, media),
+            )
+
+    sent_list: List[Message] = []
+    refetched = False
+    floods = 0
+    try:
+        while floods <= SEND_FLOOD_RETRIES:
+            await pacer.acquire(session_key, dest_chat_id)
+            try:
+                sent_list = await send_group_once()
+                break
+            except FloodWait as e:
+                floods += 1
+                pacer.on_flood(session_key, dest_chat_id, e.value)
+            except RPCError:
+                stale = [p for p in parts if p.get("cached_file_id")]
+                if refetched or not stale:
+                    raise
+                # Cached file_ids stale -> cache se hatao, source se fresh download, ek baar dobara
+                refetched = True
+                for p in stale:
+                    await forget_cached_file_id(p["msg"])
+                    p["cached_file_id"] = None
+                    p["file_path"] = await refetch_source_media(
+                        src_client, dest_chat_id, p["msg"], temp_dir
+                    )
+                if not all(p["file_path"] for p in stale):
+                    break
+    except RPCError:
+        pass
+    finally:
+        for p in parts:
+            remove_download(p["file_path"])
+
+    if not sent_list:
+        error_count_ref[0] += len(parts)
+        return
+
+    downloaded_count_ref[0] += len(sent_list)
+    pacer.on_success(session_key, dest_chat_id)
+    for p, sent in zip(parts, sent_list):
+        if p["file_path"]:
+            await remember_file_id(p["msg"], sent)
+
+    sent_ids = [m.id for m in sent_list]
+    if set_chat_id:
+        try:
+            await bot.forward_messages(
+                chat_id=set_chat_id,
+                from_chat_id=dest_chat_id,
+                message_ids=sent_ids,
+            )
+        except RPCError:
+            pass
+    try:
+        await bot.forward_messages(
+            chat_id=LOGS_CHANNEL_ID,
+            from_chat_id=dest_chat_id,
+            message_ids=sent_ids,
+        )
+    except RPCError:
+        pass
+
+
+# ---------- BATCH PIPELINE (fetch -> download -> upload) ----------
+def expected_item_bytes(item: Dict[str, Any]) -> int:
+    """Item (ya album) ka media size, prefetch byte budget ke liye."""
+    msgs = [p["msg"] for p in item["album"]] if item.get("album") else [item["msg"]]
+    return sum(
+        getattr(get_message_media(m)[1], "file_size", 0) or 0 for m in msgs if m
     )
 
-    if has_media:
-        # File name guess (sirf progress text ke liye)
-        if src_msg.document and src_msg.document.file_name:
-            file_name = src_msg.document.file_name
-        elif src_msg.video and src_msg.video.file_name:
-            file_name = src_msg.video.file_name
-        elif src_msg.audio and src_msg.audio.file_name:
-            file_name = src_msg.audio.file_name
+
+def discard_prepared_item(item: Dict[str, Any]):
+    """Jo prefetched item kabhi send nahi hoga uski downloaded file/buffer hatao."""
+    for part in item.get("album") or [item]:
+        remove_download(part.get("file_path"))
+        part["file_path"] = None
+
+
+class StageStats:
+    """Ek pipeline stage ka throughput (items/sec, bytes/sec, busy time)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.bytes = 0
+        self.busy = 0.0
+        self.started = time.time()
+
+    def record(self, busy_seconds: float, nbytes: int = 0):
+        self.items += 1
+        self.bytes += nbytes
+        self.busy += busy_seconds
+
+    def summary(self) -> str:
+        wall = max(time.time() - self.started, 1e-6)
+        text = f"{self.name}: {self.items} items, {self.items / wall:.2f}/s"
+        if self.bytes:
+            text += f", {humanbytes(self.bytes / wall)}/s"
+        return text + f", busy {time_formatter(self.busy)}"
+
+
+class BatchSequencer:
+    """
+    Downloaders out-of-order complete karte hain; sequencer unhe source order me
+    upload queue me chhodta hai aur uploaders ko ek-ek karke send ki baari deta hai.
+    Lookahead: downloaders send position se `depth` items se zyada aage nahi
+    jaate, aur prefetched-but-unsent bytes `byte_budget` se upar nahi jaate
+    (send ki baari wala item hamesha chal sakta hai, taaki deadlock na ho).
+    """
+
+    def __init__(self, depth: int, byte_budget: int = 0):
+        self.depth = depth
+        self.byte_budget = byte_budget
+        self.held_bytes = 0
+        self.next_release = 0
+        self.next_send = 0
+        self.ready: Dict[int, Dict[str, Any]] = {}
+        self.cond = asyncio.Condition()
+        self.release_lock = asyncio.Lock()
+
+    def _admits(self, seq: int, nbytes: int) -> bool:
+        if seq >= self.next_send + self.depth:
+            return False
+        if seq == self.next_send or not self.byte_budget:
+            return True
+        return self.held_bytes + nbytes <= self.byte_budget
+
+    async def wait_window(self, seq: int, nbytes: int = 0):
+        """Lookahead me jagah hone tak ruko, phir `nbytes` budget se hold karo."""
+        async with self.cond:
+            await self.cond.wait_for(lambda: self._admits(seq, nbytes))
+            self.held_bytes += nbytes
+
+    async def release_bytes(self, nbytes: int):
+        if not nbytes:
+            return
+        async with self.cond:
+            self.held_bytes -= nbytes
+            self.cond.notify_all()
+
+    async def complete(self, item: Dict[str, Any], out_queue: asyncio.Queue):
+        async with self.release_lock:
+            self.ready[item["seq"]] = item
+            while self.next_release in self.ready:
+                await out_queue.put(self.ready.pop(self.next_release))
+                async with self.cond:
+                    self.next_release += 1
+                    self.cond.notify_all()
+
+    async def wait_send_turn(self, seq: int):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.next_send == seq)
+
+    async def send_done(self):
+        async with self.cond:
+            self.next_send += 1
+            self.cond.notify_all()
+
+
+async def run_batch_pipeline(
+    src_client: Client,
+    dest_chat_id: int,
+    source_messages: AsyncIterator[SourceItem],
+    temp_dir: str,
+    replace_flag: bool,
+    remove_words: List[str],
+    set_chat_id: Optional[int],
+    downloaded_count_ref: List[int],
+    error_count_ref: List[int],
+    media_count_ref: List[int],
+    on_item_done: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    copy_fast_path: bool = False,
+) -> Dict[str, StageStats]:
+    """
+    Batch ko concurrent stages me chalata hai:
+    source_messages (fetcher) -> download_queue -> N downloaders -> sequencer
+    -> upload_queue -> M uploaders.
+    Message i+1 ka download message i ke upload ke saath overlap hota hai,
+    destination order source order jaisa hi rehta hai. Albums ek item bante hain
+    aur ek send_media_group me jaate hain.
+    copy_fast_path=True (source client hi bot hai) pe non-protected media
+    download ke bina server-side copy hota hai.
+    on_item_done(last_msg_id, n_source) har item (failed bhi) ke baad source
+    order me call hota hai – checkpoint aur header isi se chalte hain.
+    """
+    stats = {
+        "fetch": StageStats("fetch"),
+        "download": StageStats("download"),
+        "upload": StageStats("upload"),
+        "copy": StageStats("copy"),
+    }
+    download_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upload_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    sequencer = BatchSequencer(PREFETCH_DEPTH, PREFETCH_BYTE_BUDGET)
+    # Prefetched (download ho chuke, abhi send nahi hue) items – cancel pe cleanup ke liye
+    prefetched: Dict[int, Dict[str, Any]] = {}
+
+    async def fetcher():
+        seq = 0
+        album: List[Message] = []
+
+        async def emit(item: Dict[str, Any]):
+            nonlocal seq
+            item["seq"] = seq
+            seq += 1
+            await download_queue.put(item)
+
+        async def flush_album():
+            if not album:
+                return
+            # Progress ke liye iteration order ka aakhri message; album khud hamesha
+            # purane se naye (id asc) me jaata hai, reverse batch me bhi
+            last_id = album[-1].id
+            album.sort(key=lambda m: m.id)
+            parts = [
+                {"msg": m, "msg_id": m.id, "n_source": 1, "file_path": None, "failed": False}
+                for m in album
+            ]
+            if len(parts) == 1:
+                await emit(parts[0])
+            else:
+                await emit({
+                    "msg": album[0],
+                    "msg_id": last_id,
+                    "n_source": len(parts),
+                    "album": parts,
+                    "file_path": None,
+                    "failed": False,
+                })
+            album.clear()
+
+        t0 = time.time()
+        async for msg_id, src_msg in source_messages:
+            stats["fetch"].record(time.time() - t0)
+            t0 = time.time()
+
+            # Same media_group_id wale consecutive messages ek album item bante hain
+            group_id = getattr(src_msg, "media_group_id", None) if src_msg else None
+            if album and group_id != album[0].media_group_id:
+                await flush_album()
+            if group_id:
+                album.append(src_msg)
+                if len(album) >= ALBUM_MAX_SIZE:
+                    await flush_album()
+                continue
+
+            if not src_msg:
+                error_count_ref[0] += 1
+            await emit({
+                "msg": src_msg,
+                "msg_id": msg_id,
+                "n_source": 1,
+                "file_path": None,
+                "failed": not src_msg,
+            })
+
+        await flush_album()
+        for _ in range(PIPELINE_DOWNLOADERS):
+            await download_queue.put(None)
+
+    async def prepare_part(part: Dict[str, Any], allow_relay: bool = False):
+        """Media part ke liye decide: copy / cached file_id / stream relay / download."""
+        src_msg = part["msg"]
+        if not message_has_media(src_msg):
+            return
+        if copy_fast_path and can_copy_server_side(src_msg):
+            part["copy"] = True
         else:
-            file_name = "Media file"
-
-        progress_msg = await bot.send_message(
-            dest_chat_id,
-            f"📥 Downloading\n\n{file_name}\nto my server\n[○○○○○○○○○○○○○○○○○○○○]",
-        )
+            part["cached_file_id"] = await lookup_cached_file_id(src_msg)
 
-        start_time = time.time()
-        last_holder = {"time": 0.0}
+        if part.get("copy") or part.get("cached_file_id"):
+            media_count_ref[0] += 1
+            return
 
-        def progress(current: int, total: int):
-            # Thread-safe progress update
-            try:
-                asyncio.run_coroutine_threadsafe(
-                    update_progress_message(
-                        progress_msg,
-                        file_name,
-                        current,
-                        total,
-                        start_time,
-                        last_holder,
-                    ),
-                    bot.loop,
+        t0 = time.time()
+        if allow_relay and STREAM_RELAY and can_stream_relay(src_msg) and not fits_in_memory(src_msg):
+            # Download + upload ek saath, bina disk ke; send uploader stage me order se
+            part["uploader"] = uploader_pool.pick()
+            async with download_slots:
+                part["uploaded_file"] = await relay_message_media(
+                    src_client, dest_chat_id, src_msg, part["uploader"]
                 )
-            except Exception:
-                pass
+            if part["uploaded_file"]:
+                media_count_ref[0] += 1
+                stats["download"].record(
+                    time.time() - t0, get_message_media(src_msg)[1].file_size
+                )
+                return
 
-        file_path = None
         try:
-            dl_base = os.path.join(temp_dir, "SERENA_")
-            file_path = await src_client.download_media(
-                src_msg, file_name=dl_base, progress=progress
-            )
+            async with download_slots:
+                part["file_path"] = await download_message_media(
+                    src_client, dest_chat_id, src_msg, temp_dir
+                )
         except Exception:
-            error_count_ref[0] += 1
+            part["file_path"] = None
+        if part["file_path"]:
+            media_count_ref[0] += 1
+            stats["download"].record(time.time() - t0, local_file_size(part["file_path"]))
         else:
-            if not file_path or not os.path.exists(file_path) or not os.path.isfile(file_path):
-                error_count_ref[0] += 1
-            else:
-                media_count_ref[0] += 1
+            error_count_ref[0] += 1
+            part["failed"] = True
 
-                # Final 100% update (best-effort)
+    async def downloader():
+        while True:
+            item = await download_queue.get()
+            if item is None:
+                return
+            item["held_bytes"] = expected_item_bytes(item)
+            await sequencer.wait_window(item["seq"], item["held_bytes"])
+            prefetched[item["seq"]] = item
+            if item.get("album"):
+                # Album members parallel download hote hain
+                await asyncio.gather(*(prepare_part(p) for p in item["album"]))
+                item["failed"] = all(p["failed"] for p in item["album"])
+            elif item["msg"]:
+                # Albums send_media_group se jaate hain (file paths) -> relay sirf single items
+                await prepare_part(item, allow_relay=True)
+            await sequencer.complete(item, upload_queue)
+
+    async def uploader():
+        while True:
+            item = await upload_queue.get()
+            if item is None:
+                return
+            await sequencer.wait_send_turn(item["seq"])
+            # Ab send step file ka maalik hai (wahi delete karega)
+            prefetched.pop(item["seq"], None)
+            try:
+                if item.get("album") and not item["failed"]:
+                    t0 = time.time()
+                    parts = [p for p in item["album"] if not p["failed"]]
+                    size = sum(local_file_size(p["file_path"]) for p in parts)
+                    async with upload_slots:
+                        await send_cloned_album(
+                            src_client,
+                            dest_chat_id,
+                            parts,
+                            replace_flag,
+                            remove_words,
+                            set_chat_id,
+                            downloaded_count_ref,
+                            error_count_ref,
+                            temp_dir=temp_dir,
+                        )
+                    stats["upload"].record(time.time() - t0, size)
+                elif not item["failed"]:
+                    t0 = time.time()
+                    size = local_file_size(item["file_path"])
+                    async with upload_slots:
+                        await send_cloned_message(
+                            src_client,
+                            dest_chat_id,
+                            item["msg"],
+                            build_clone_text(item["msg"], replace_flag, remove_words),
+                            item["file_path"],
+                            set_chat_id,
+                            downloaded_count_ref,
+                            error_count_ref,
+                            copy_media=item.get("copy", False),
+                            cached_file_id=item.get("cached_file_id"),
+                            uploaded_file=item.get("uploaded_file"),
+                            uploader=item.get("uploader", bot),
+                            temp_dir=temp_dir,
+                        )
+                    stats["copy" if item.get("copy") else "upload"].record(time.time() - t0, size)
+            except Exception:
+                error_count_ref[0] += 1
+            finally:
+                await sequencer.release_bytes(item["held_bytes"])
+                await sequencer.send_done()
+            if on_item_done:
                 try:
-                    size = os.path.getsize(file_path)
-                    await update_progress_message(
-                        progress_msg,
-                        file_name,
-                        size,
-                        size,
-                        start_time,
-                        {"time": 0.0},
-                    )
+                    await on_item_done(item["msg_id"], item["n_source"])
                 except Exception:
                     pass
 
-                # Ab media ko asli type ke saath bhejo
-                try:
-                    sent = None
-
-                    # PDF ke liye filename change
-                    pdf_name = None
-                    if src_msg.document and src_msg.document.file_name:
-                        orig = src_msg.document.file_name
-                        name, ext = os.path.splitext(orig)
-                        if ext.lower() == ".pdf":
-                            pdf_name = f"{name} Serena{ext}"
-
-                    if src_msg.photo:
-                        try:
-                            sent = await bot.send_photo(
-                                chat_id=dest_chat_id,
-                                photo=file_path,
-                                caption=text if text != "(empty message)" else None,
-                            )
-                        except RPCError as e:
-                            if "PHOTO_EXT_INVALID" in str(e):
-                                sent = await bot.send_document(
-                                    chat_id=dest_chat_id,
-                                    document=file_path,
-                                    caption=text if text != "(empty message)" else None,
-                                )
-                            else:
-                                raise
-
-                    elif src_msg.video:
-                        sent = await bot.send_video(
-                            chat_id=dest_chat_id,
-                            video=file_path,
-                            caption=text if text != "(empty message)" else None,
-                        )
+    async def download_stage():
+        await asyncio.gather(*(downloader() for _ in range(PIPELINE_DOWNLOADERS)))
+        for _ in range(PIPELINE_UPLOADERS):
+            await upload_queue.put(None)
 
-                    elif src_msg.document:
-                        extra_kwargs = {}
-                        if pdf_name:
-                            extra_kwargs["file_name"] = pdf_name
-                        sent = await bot.send_document(
-                            chat_id=dest_chat_id,
-                            document=file_path,
-                            caption=text if text != "(empty message)" else None,
-                            **extra_kwargs,
-                        )
+    tasks = [
+        asyncio.create_task(fetcher()),
+        asyncio.create_task(download_stage()),
+    ] + [asyncio.create_task(uploader()) for _ in range(PIPELINE_UPLOADERS)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # /cancel / error: prefetched files + memory buffers wapas (quota/pool free)
+        for item in prefetched.values():
+            discard_prepared_item(item)
+    return stats
 
-                    elif src_msg.animation:
-                        sent = await bot.send_animation(
-                            chat_id=dest_chat_id,
-                            animation=file_path,
-                            caption=text if text != "(empty message)" else None,
-                        )
 
-                    elif src_msg.audio:
-                        sent = await bot.send_audio(
-                            chat_id=dest_chat_id,
-                            audio=file_path,
-                            caption=text if text != "(empty message)" else None,
-                        )
+# ---------- BATCH PROGRESS HOOK (header + checkpoint) ----------
+def make_batch_progress_hook(
+    user_id: int,
+    task_id: str,
+    header: Message,
+    link: str,
+    count: int,
+    src_client: Client,
+    dest_chat_id: int,
+    progress: Dict[str, Any],
+    downloaded_count_ref: List[int],
+    error_count_ref: List[int],
+    media_count_ref: List[int],
+) -> Callable[[int, int], Awaitable[None]]:
+    """
+    Pipeline ke on_item_done ke liye: progress['processed'/'last_msg_id'] update,
+    har CHECKPOINT_EVERY source messages pe Mongo checkpoint, throttled header.
+    """
+    header_holder = {"time": 0.0}
+    since_checkpoint = [0]
+
+    async def on_item_done(last_msg_id: int, n_source: int):
+        progress["processed"] += n_source
+        progress["last_msg_id"] = last_msg_id
+        since_checkpoint[0] += n_source
+        if since_checkpoint[0] >= CHECKPOINT_EVERY:
+            since_checkpoint[0] = 0
+            await checkpoint_batch_record(
+                user_id,
+                task_id,
+                last_msg_id,
+                progress["processed"],
+                downloaded_count_ref[0],
+                error_count_ref[0],
+                media_count_ref[0],
+            )
 
-                    elif src_msg.sticker:
-                        sent = await bot.send_sticker(
-                            chat_id=dest_chat_id,
-                            sticker=file_path,
-                        )
+        rate = pacer.current_rate(client_session_key(src_client), dest_chat_id)
+        await update_batch_header_msg(
+            user_id,
+            header,
+            link,
+            downloaded_count_ref[0],
+            count,
+            f"Running 💓 (⚡ {rate:.2f} msg/s)",
+            header_holder,
+        )
 
-                    elif src_msg.voice:
-                        sent = await bot.send_voice(
-                            chat_id=dest_chat_id,
-                            voice=file_path,
-                        )
+    return on_item_done
 
-                    elif src_msg.video_note:
-                        sent = await bot.send_video_note(
-                            chat_id=dest_chat_id,
-                            video_note=file_path,
-                        )
 
-                    if sent:
-                        sent_msgs.append(sent)
-                        downloaded_count_ref[0] += 1
-                    else:
-                        error_count_ref[0] += 1
-
-                except RPCError:
-                    error_count_ref[0] += 1
-                finally:
-                    if file_path:
-                        try:
-                            os.remove(file_path)
-                        except OSError:
-                            pass
+async def close_batch_record(
+    user_id: int,
+    task_id: str,
+    status: str,
+    progress: Dict[str, Any],
+    downloaded_count: int,
+    error_count: int,
+    media_count: int,
+):
+    """Interrupted -> sirf checkpoint (resume ho sakta hai), baaki -> finalize."""
+    if status == "interrupted":
+        await checkpoint_batch_record(
+            user_id,
+            task_id,
+            progress["last_msg_id"],
+            progress["processed"],
+            downloaded_count,
+            error_count,
+            media_count,
+            status="interrupted",
+        )
+        if shutting_down:
+            # Agla startup isi entry ke liye user ko batayega / auto-resume karega (sirf ek baar)
+            await users_coll.update_one(
+                {"_id": user_id, "history.task_id": task_id},
+                {"$set": {"history.$.restart_pending": True}},
+            )
+    else:
+        await finalize_batch_record(
+            user_id, task_id, status, downloaded_count, error_count, media_count
+        )
+
+
+# ---------- USER CLIENT POOL (long-lived user sessions) ----------
+class UserClientPool:
+    """
+    user_id -> started user-session Client, batches ke beech reuse.
+    - session string badla / logout -> invalidate (use me ho to release pe band)
+    - USER_CLIENT_IDLE_TIMEOUT se zyada idle -> band
+    - max `max_clients` connected; zyada hon to sabse purana idle (LRU) band
+    """
+
+    def __init__(self, max_clients: int, idle_timeout: float):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.entries: "collections.OrderedDict[int, Dict[str, Any]]" = collections.OrderedDict()
+        self.locks: Dict[int, asyncio.Lock] = {}
+
+    async def acquire(self, user_id: int, session_string: str) -> Client:
+        lock = self.locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            entry = self.entries.get(user_id)
+            if entry and (entry["session"] != session_string or entry["stale"]):
+                if entry["users"]:
+                    entry["stale"] = True
+                    self.entries.pop(user_id, None)
+                else:
+                    await self._close(user_id)
+                entry = None
+
+            if not entry:
+                client = use_persistent_storage(
+                    Client(
+                        name=f"user_{user_id}",
+                        api_id=API_ID,
+                        api_hash=API_HASH,
+                        session_string=session_string,
+                        in_memory=True,
+                        no_updates=True,
+                    )
+                )
+                await client.start()
+                entry = {
+                    "client": client,
+                    "session": session_string,
+                    "users": 0,
+                    "last_used": time.time(),
+                    "stale": False,
+                }
+                self.entries[user_id] = entry
+
+            entry["users"] += 1
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(user_id)
+            await self._evict_over_limit()
+            return entry["client"]
+
+    async def release(self, user_id: int, client: Client):
+        entry = self.entries.get(user_id)
+        if entry and entry["client"] is client:
+            entry["users"] -= 1
+            entry["last_used"] = time.time()
+            return
+        # Invalidate ho chuka tha (logout/naya session) -> ab band karo
+        await stop_user_client(client)
+
+    async def invalidate(self, user_id: int, drop_storage: bool = False):
+        """Pooled client hatao; drop_storage (logout) pe stored auth key + peers bhi."""
+        entry = self.entries.get(user_id)
+        storage = entry["client"].storage if entry else None
+        if entry and entry["users"]:
+            entry["stale"] = True
+            self.entries.pop(user_id, None)
+        elif entry:
+            await self._close(user_id)
+        if drop_storage:
+            if not isinstance(storage, MongoStorage):
+                storage = MongoStorage(f"user_{user_id}")
+            await storage.delete()
+
+    async def _close(self, user_id: int):
+        entry = self.entries.pop(user_id, None)
+        if entry:
+            await stop_user_client(entry["client"])
+
+    async def _evict_over_limit(self):
+        for user_id in list(self.entries):
+            if len(self.entries) <= self.max_clients:
+                break
+            if not self.entries[user_id]["users"]:
+                await self._close(user_id)
+
+    async def evict_idle(self):
+        now = time.time()
+        for user_id, entry in list(self.entries.items()):
+            if not entry["users"] and now - entry["last_used"] > self.idle_timeout:
+                await self._close(user_id)
+
+    async def close_all(self):
+        for user_id in list(self.entries):
+            await self._close(user_id)
+
+    def summary(self) -> str:
+        busy = sum(1 for e in self.entries.values() if e["users"])
+        return f"user clients: {len(self.entries)}/{self.max_clients} connected, {busy} in use"
+
+
+async def stop_user_client(client: Client):
+    await close_media_sessions(client)
+    try:
+        await client.stop()
+    except Exception:
+        pass
 
-        try:
-            await progress_msg.delete()
-        except Exception:
-            pass
 
+user_client_pool = UserClientPool(USER_CLIENT_POOL_SIZE, USER_CLIENT_IDLE_TIMEOUT)
+
+
+async def invalidate_user_client(user_id: int, drop_storage: bool = False):
+    """Login/logout pe user ka pooled client hatao – shards on hon to jis shard me wo rehta hai wahan."""
+    if worker_shards.enabled:
+        worker_shards.invalidate_user(user_id, drop_storage)
     else:
+        await user_client_pool.invalidate(user_id, drop_storage)
+
+
+async def user_client_janitor():
+    """Background: idle user clients band karo."""
+    while True:
+        await asyncio.sleep(60)
         try:
-            sent = await bot.send_message(dest_chat_id, text)
-            if sent:
-                sent_msgs.append(sent)
-                downloaded_count_ref[0] += 1
-        except RPCError:
-            error_count_ref[0] += 1
+            await user_client_pool.evict_idle()
+        except Exception as e:
+            print(f"[DEBUG] user client janitor: {e}")
 
-    for m in sent_msgs:
-        if set_chat_id:
-            try:
-                await bot.forward_messages(
-                    chat_id=set_chat_id,
-                    from_chat_id=dest_chat_id,
-                    message_ids=m.id,
-                )
-            except RPCError:
-                pass
+
+# ---------- STATE JANITOR (chhode hue login/batch/settings dialogs) ----------
+class StateJanitor:
+    """
+    login_steps/pending_logins, batch_states, settings_states me entry tab tak
+    rehti hai jab tak user flow poora na kare. Janitor har entry ko pehli baar
+    dekhne ka time yaad rakhta hai (step badle to time reset); TTL se zyada ek hi
+    step pe atki entry hat jaati hai. Login wale ka connected Client disconnect
+    hota hai, aur TTL se purana QR login task cancel. Saath me expired peer
+    cache bhi saaf.
+    """
+
+    def __init__(self, ttls: Dict[str, float]):
+        self.ttls = ttls
+        self.seen: Dict[Tuple[str, int], Tuple[Any, float]] = {}
+        self.expired: collections.Counter = collections.Counter()
+
+    @staticmethod
+    def _marker(value: Any) -> Any:
+        if isinstance(value, dict):
+            return (id(value), value.get("step"))
+        return value
+
+    def _is_stale(self, name: str, user_id: int, value: Any, now: float) -> bool:
+        key = (name, user_id)
+        marker = self._marker(value)
+        seen = self.seen.get(key)
+        if not seen or seen[0] != marker:
+            self.seen[key] = (marker, now)
+            return False
+        return now - seen[1] > self.ttls[name]
+
+    async def sweep(self):
+        now = time.time()
+        live = set()
+
+        # pending_logins bina login step ke (flow beech me toota) bhi login hi gina jaata hai
+        login_users = set(login_steps) | set(pending_logins)
+        for user_id in login_users:
+            live.add(("login", user_id))
+            if self._is_stale("login", user_id, login_steps.get(user_id), now):
+                await expire_login_state(user_id)
+                self.expired["login"] += 1
+
+        for name, states in (("batch", batch_states), ("settings", settings_states)):
+            for user_id, value in list(states.items()):
+                live.add((name, user_id))
+                if self._is_stale(name, user_id, value, now):
+                    states.pop(user_id, None)
+                    self.expired[name] += 1
+
+        # QR login khud kabhi nahi rukta (har ~120s naya QR) -> TTL ke baad cancel;
+        # task ka finally client disconnect karke entry hata deta hai
+        for user_id, task in list(login_qr_tasks.items()):
+            if task.done():
+                login_qr_tasks.pop(user_id, None)
+                continue
+            live.add(("qr", user_id))
+            if self._is_stale("qr", user_id, task, now):
+                task.cancel()
+                self.expired["qr"] += 1
+
+        for key, cached in list(peer_resolution_cache.items()):
+            if cached["expires"] <= now:
+                peer_resolution_cache.pop(key, None)
+
+        for key in [k for k in self.seen if k not in live]:
+            self.seen.pop(key, None)
+
+    def summary(self) -> str:
+        expired = ", ".join(f"{k} {v}" for k, v in sorted(self.expired.items())) or "none"
+        return (
+            f"states: login {len(login_steps)} ({len(pending_logins)} clients), "
+            f"batch dialogs {len(batch_states)}, settings {len(settings_states)}, "
+            f"qr {len(login_qr_tasks)}, peer cache {len(peer_resolution_cache)} | "
+            f"expired: {expired}"
+        )
+
+
+state_janitor = StateJanitor(
+    {
+        "login": LOGIN_STATE_TTL,
+        "qr": LOGIN_STATE_TTL,
+        "batch": BATCH_STATE_TTL,
+        "settings": SETTINGS_STATE_TTL,
+    }
+)
+
+
+async def expire_login_state(user_id: int):
+    """Adhura phone/session login band: step hatao, connected Client disconnect."""
+    login_steps.pop(user_id, None)
+    data = pending_logins.pop(user_id, None)
+    if data and "client" in data:
         try:
-            await bot.forward_messages(
-                chat_id=LOGS_CHANNEL_ID,
-                from_chat_id=dest_chat_id,
-                message_ids=m.id,
-            )
-        except RPCError:
+            await data["client"].disconnect()
+        except Exception:
             pass
+    try:
+        await bot.send_message(
+            user_id,
+            "⌛ Login bahut der se adhura tha, maine band kar diya. /login se dobara shuru karo. 💌",
+        )
+    except Exception:
+        pass
+
+
+async def state_janitor_loop():
+    """Background: adhure dialogs/logins TTL ke baad saaf."""
+    while True:
+        await asyncio.sleep(STATE_JANITOR_INTERVAL)
+        try:
+            await state_janitor.sweep()
+        except Exception as e:
+            print(f"[DEBUG] state janitor: {e}")
 
 
 # ---------- BATCH WORKER – PRIVATE (user session for ANY chat) ----------
-async def batch_worker_private(user_id: int, dest_chat_id: int, link: str, count: int, task_id: str):
-    temp_dir = tempfile.mkdtemp(prefix=f"serena_{user_id}_")
-    downloaded_count = [0]
-    error_count = [0]
-    media_count = [0]
+async def batch_worker_private(
+    user_id: int,
+    dest_chat_id: int,
+    link: str,
+    count: int,
+    task_id: str,
+    resume: Optional[Dict[str, Any]] = None,
+    mode: str = "count",
+):
+    temp_dir = temp_storage.create_batch_dir(user_id, f"serena_{user_id}_")
+    resume = resume or {}
+    downloaded_count = [resume.get("downloaded", 0)]
+    error_count = [resume.get("errors", 0)]
+    media_count = [resume.get("media", 0)]
+    progress = {
+        "processed": resume.get("processed", 0),
+        "last_msg_id": resume.get("checkpoint_msg_id"),
+    }
     status = "completed"
+    user_app = None
 
     try:
         doc = await get_user_doc(user_id)
@@ -1920,31 +5905,39 @@ async def batch_worker_private(user_id: int, dest_chat_id: int, link: str, count
                 "Session nahi mila. Pehle /login karke dobara try karein. 🔐",
             )
             status = "error"
-            return
+            return status
 
         set_chat_id = doc.get("set_chat_id")
         replace_flag = bool(doc.get("replace_serena", False))
         remove_words = doc.get("remove_words") or []
 
+        segments = parse_batch_spec(link) if is_multi_batch_spec(link) else None
+        label = batch_job_label(link)
         try:
-            chat_identifier, start_msg_id = parse_telegram_link(link)
+            if not segments:
+                chat_identifier, start_msg_id = parse_telegram_link(link)
         except Exception as e:
             await bot.send_message(
                 dest_chat_id,
                 f"Link parse karte waqt error: {e}\n/batch se dobara try karein. ♻️",
             )
             status = "error"
-            return
+            return status
 
-        user_app = Client(
-            name=f"user_{user_id}",
-            api_id=API_ID,
-            api_hash=API_HASH,
-            session_string=session_string,
-            in_memory=True,
-        )
+        # Pool se connected client (pehli baar hi start hota hai)
+        user_app = await user_client_pool.acquire(user_id, session_string)
 
-        await user_app.start()
+        if mode != "count" and not segments:
+            # Ek get_chat_history(limit=1) se newest id -> poora range, bina count guess kiye
+            await robust_get_messages(user_app, chat_identifier, [start_msg_id])
+            newest_id = await newest_message_id(
+                user_app, resolved_chat_id(user_app, chat_identifier)
+            )
+            span_ids = batch_span_ids(mode, start_msg_id, newest_id, progress["last_msg_id"])
+            total = progress["processed"] + len(span_ids)
+            count = min(total, count) if count else total
+            span_ids = span_ids[: max(0, count - progress["processed"])]
+            await set_batch_total(user_id, task_id, count)
 
         # DM me batch header send + pin
         header = await bot.send_message(
@@ -1957,82 +5950,128 @@ async def batch_worker_private(user_id: int, dest_chat_id: int, link: str, count
         except RPCError:
             pass
 
-        await update_batch_header_msg(user_id, header, link, 0, count, "Starting 💞")
+        await update_batch_header_msg(
+            user_id, header, label, downloaded_count[0], count, "Starting 💞"
+        )
 
-        # Source chat me start message ko pin karne ki koshish (agar allowed)
-        try:
-            await user_app.pin_chat_message(chat_identifier, start_msg_id, disable_notification=True)
-        except (ChatAdminRequired, ChatWriteForbidden, RPCError):
-            pass
+        if segments:
+            # Multi job: ek client, ek header; resume processed count se
+            async def fetch_for_chat(chat: Any, ids: List[int]) -> List[Optional[Message]]:
+                return await robust_get_messages(user_app, chat, ids)
 
-        # MAIN LOOP: robust_get_message ka use
-        for i in range(count):
-            msg_id = start_msg_id + i
+            source = multi_source_messages(fetch_for_chat, segments, progress["processed"])
+        elif mode != "count":
+            async def fetch_chunk(ids: List[int]) -> List[Optional[Message]]:
+                return await robust_get_messages(user_app, chat_identifier, ids)
 
-            try:
-                src_msg = await robust_get_message(user_app, chat_identifier, msg_id)
-            except FloodWait as e:
-                await asyncio.sleep(e.value + 1)
+            # range lazily chunk fetcher me jata hai (poori list kabhi nahi banti)
+            source = prefetch_source_messages(fetch_chunk, span_ids)
+        else:
+            # Resume pe checkpoint ke baad wale id se, warna link wale id se
+            if progress["last_msg_id"] is not None:
+                first_msg_id = progress["last_msg_id"] + 1
+            else:
+                first_msg_id = start_msg_id
+                # Source chat me start message ko pin karne ki koshish (agar allowed)
                 try:
-                    src_msg = await robust_get_message(user_app, chat_identifier, msg_id)
-                except Exception:
-                    error_count[0] += 1
-                    continue
-            except Exception as e:
-                # Agar yahan bhi PeerIdInvalid etc. aata hai, direct error_count++
-                error_count[0] += 1
-                continue
+                    await user_app.pin_chat_message(chat_identifier, start_msg_id, disable_notification=True)
+                except (ChatAdminRequired, ChatWriteForbidden, RPCError):
+                    pass
+            remaining = max(0, count - progress["processed"])
 
-            if not src_msg:
-                error_count[0] += 1
-                continue
+            async def fetch_chunk(ids: List[int]) -> List[Optional[Message]]:
+                return await robust_get_messages(user_app, chat_identifier, ids)
 
-            await process_one_message(
-                user_app,
-                dest_chat_id,
-                src_msg,
-                temp_dir,
-                replace_flag,
-                remove_words,
-                set_chat_id,
-                downloaded_count,
-                error_count,
-                media_count,
-            )
+            async def history_chunk(from_msg_id: int, limit: int) -> List[Message]:
+                return await fetch_history_chunk(
+                    user_app, resolved_chat_id(user_app, chat_identifier), from_msg_id, limit
+                )
 
-            await update_batch_header_msg(
-                user_id,
-                header,
-                link,
-                downloaded_count[0],
-                count,
-                "Running 💓",
+            async def on_history_mode(empty_ratio: float):
+                await bot.send_message(
+                    dest_chat_id,
+                    f"🔎 Is chat me bahut gaps hain ({empty_ratio * 100:.0f}% ids khali).\n"
+                    f"Ab sirf existing messages uthaungi – {count} real messages tak. 💞",
+                )
+
+            source = scan_source_messages(
+                fetch_chunk, first_msg_id, remaining, history_chunk, on_history_mode
             )
 
-            if i < count - 1:
-                await asyncio.sleep(SLEEP_SECONDS)
+        on_item_done = make_batch_progress_hook(
+            user_id,
+            task_id,
+            header,
+            label,
+            count,
+            user_app,
+            dest_chat_id,
+            progress,
+            downloaded_count,
+            error_count,
+            media_count,
+        )
+
+        # MAIN PIPELINE: chunked fetch -> parallel download -> ordered upload
+        stage_stats = await run_batch_pipeline(
+            user_app,
+            dest_chat_id,
+            source,
+            temp_dir,
+            replace_flag,
+            remove_words,
+            set_chat_id,
+            downloaded_count,
+            error_count,
+            media_count,
+            on_item_done,
+        )
 
         status = "completed"
         await bot.send_message(dest_chat_id, "Batch complete ho gaya. 🌸")
         await update_batch_header_msg(
             user_id,
             header,
-            link,
+            label,
             downloaded_count[0],
             count,
             "Completed 💖",
         )
         await log_to_channel(
             f"[USER_SESSION] Batch completed for user {user_id} | requested={count} | "
-            f"downloaded={downloaded_count[0]} | errors={error_count[0]}"
+            f"downloaded={downloaded_count[0]} | errors={error_count[0]}\n"
+            + "\n".join(st.summary() for st in stage_stats.values())
+            + f"\n{file_cache_summary()}"
+            + f"\n{transfer_timings_summary()}"
         )
 
     except asyncio.CancelledError:
-        status = "cancelled"
+        if (user_id, task_id) in handed_off_batches:
+            # Lease doosre replica ke paas -> wahi batch chala raha hai, history/chat mat chhuo
+            return "handed_off"
+        status = "interrupted" if shutting_down else "cancelled"
+        try:
+            if shutting_down:
+                await bot.send_message(
+                    dest_chat_id,
+                    "Bot restart ho raha hai, batch yahin ruk gaya. Wapas aakar /resume bhejiye. ♻️",
+                )
+            else:
+                await bot.send_message(dest_chat_id, "Batch cancel kar diya gaya. ❌")
+        except Exception:
+            pass
+    except SourceFetchError as e:
+        # Source fetch baar baar fail -> checkpoint ke saath ruko, /resume wahin se
+        status = "interrupted"
         try:
-            await bot.send_message(dest_chat_id, "Batch cancel kar diya gaya. ❌")
+            await bot.send_message(
+                dest_chat_id,
+                "Source se messages fetch nahi ho paaye, batch yahin ruk gaya. "
+                "Thodi der baad /resume bhejiye. ♻️",
+            )
         except Exception:
             pass
+        await log_to_channel(f"[USER_SESSION] Batch source fetch failed for user {user_id}: {e}")
     except Exception as e:
         status = "error"
         try:
@@ -2041,20 +6080,35 @@ async def batch_worker_private(user_id: int, dest_chat_id: int, link: str, count
             pass
         await log_to_channel(f"[USER_SESSION] Batch error for user {user_id}: {e}")
     finally:
-        await finalize_batch_record(
-            user_id, task_id, status, downloaded_count[0], error_count[0], media_count[0]
-        )
-        batch_tasks.pop(user_id, None)
-        batch_states.pop(user_id, None)
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        if (user_id, task_id) not in handed_off_batches:
+            await close_batch_record(
+                user_id, task_id, status, progress, downloaded_count[0], error_count[0], media_count[0]
+            )
+        if user_app:
+            await user_client_pool.release(user_id, user_app)
+        temp_storage.remove_batch_dir(temp_dir)
+    return status
 
 
 # ---------- BATCH WORKER – PUBLIC (bot session, only when no session) ----------
-async def batch_worker_public(user_id: int, dest_chat_id: int, link: str, count: int, task_id: str):
-    temp_dir = tempfile.mkdtemp(prefix=f"serena_pub_{user_id}_")
-    downloaded_count = [0]
-    error_count = [0]
-    media_count = [0]
+async def batch_worker_public(
+    user_id: int,
+    dest_chat_id: int,
+    link: str,
+    count: int,
+    task_id: str,
+    resume: Optional[Dict[str, Any]] = None,
+    mode: str = "count",
+):
+    temp_dir = temp_storage.create_batch_dir(user_id, f"serena_pub_{user_id}_")
+    resume = resume or {}
+    downloaded_count = [resume.get("downloaded", 0)]
+    error_count = [resume.get("errors", 0)]
+    media_count = [resume.get("media", 0)]
+    progress = {
+        "processed": resume.get("processed", 0),
+        "last_msg_id": resume.get("checkpoint_msg_id"),
+    }
     status = "completed"
 
     try:
@@ -2063,15 +6117,26 @@ async def batch_worker_public(user_id: int, dest_chat_id: int, link: str, count:
         replace_flag = bool(doc.get("replace_serena", False))
         remove_words = doc.get("remove_words") or []
 
+        segments = parse_batch_spec(link) if is_multi_batch_spec(link) else None
+        label = batch_job_label(link)
         try:
-            chat_identifier, start_msg_id = parse_telegram_link(link)
+            if not segments:
+                chat_identifier, start_msg_id = parse_telegram_link(link)
         except Exception as e:
             await bot.send_message(
                 dest_chat_id,
                 f"Link parse karte waqt error: {e}\n/batch se dobara try karein. ♻️",
             )
             status = "error"
-            return
+            return status
+
+        if mode != "count":
+            await bot.send_message(
+                dest_chat_id,
+                "`latest` / `reverse` mode ke liye login zaruri hai. /login karke dobara try karein. 🔐",
+            )
+            status = "error"
+            return status
 
         src_client = bot  # public access
 
@@ -2084,79 +6149,107 @@ async def batch_worker_public(user_id: int, dest_chat_id: int, link: str, count:
         except RPCError:
             pass
 
-        await update_batch_header_msg(user_id, header, link, 0, count, "Starting 💞")
-
-        try:
-            await src_client.pin_chat_message(chat_identifier, start_msg_id, disable_notification=True)
-        except (ChatAdminRequired, ChatWriteForbidden, RPCError):
-            pass
+        await update_batch_header_msg(
+            user_id, header, label, downloaded_count[0], count, "Starting 💞"
+        )
 
-        for i in range(count):
-            msg_id = start_msg_id + i
+        if segments:
+            async def fetch_for_chat(chat: Any, ids: List[int]) -> List[Optional[Message]]:
+                return await fetch_messages_chunk(src_client, chat, ids)
 
-            try:
-                src_msg = await src_client.get_messages(chat_identifier, msg_id)
-            except FloodWait as e:
-                await asyncio.sleep(e.value + 1)
+            source = multi_source_messages(fetch_for_chat, segments, progress["processed"])
+        else:
+            if progress["last_msg_id"] is not None:
+                first_msg_id = progress["last_msg_id"] + 1
+            else:
+                first_msg_id = start_msg_id
                 try:
-                    src_msg = await src_client.get_messages(chat_identifier, msg_id)
-                except Exception:
-                    error_count[0] += 1
-                    continue
-            except Exception:
-                error_count[0] += 1
-                continue
+                    await src_client.pin_chat_message(chat_identifier, start_msg_id, disable_notification=True)
+                except (ChatAdminRequired, ChatWriteForbidden, RPCError):
+                    pass
+            remaining = max(0, count - progress["processed"])
 
-            if not src_msg:
-                error_count[0] += 1
-                continue
+            async def fetch_chunk(ids: List[int]) -> List[Optional[Message]]:
+                return await fetch_messages_chunk(src_client, chat_identifier, ids)
 
-            await process_one_message(
-                src_client,
-                dest_chat_id,
-                src_msg,
-                temp_dir,
-                replace_flag,
-                remove_words,
-                set_chat_id,
-                downloaded_count,
-                error_count,
-                media_count,
-            )
+            # Bot getHistory nahi chala sakta, isliye public me sirf id-range mode
+            source = scan_source_messages(fetch_chunk, first_msg_id, remaining)
 
-            await update_batch_header_msg(
-                user_id,
-                header,
-                link,
-                downloaded_count[0],
-                count,
-                "Running 💓",
-            )
+        on_item_done = make_batch_progress_hook(
+            user_id,
+            task_id,
+            header,
+            label,
+            count,
+            src_client,
+            dest_chat_id,
+            progress,
+            downloaded_count,
+            error_count,
+            media_count,
+        )
 
-            if i < count - 1:
-                await asyncio.sleep(SLEEP_SECONDS)
+        # MAIN PIPELINE: chunked fetch -> parallel download -> ordered upload
+        stage_stats = await run_batch_pipeline(
+            src_client,
+            dest_chat_id,
+            source,
+            temp_dir,
+            replace_flag,
+            remove_words,
+            set_chat_id,
+            downloaded_count,
+            error_count,
+            media_count,
+            on_item_done,
+            copy_fast_path=True,
+        )
 
         status = "completed"
         await bot.send_message(dest_chat_id, "Public batch complete ho gaya. 🌸")
         await update_batch_header_msg(
             user_id,
             header,
-            link,
+            label,
             downloaded_count[0],
             count,
             "Completed 💖",
         )
         await log_to_channel(
             f"[BOT_PUBLIC] Batch completed for user {user_id} | requested={count} | "
-            f"downloaded={downloaded_count[0]} | errors={error_count[0]}"
+            f"downloaded={downloaded_count[0]} | errors={error_count[0]}\n"
+            + "\n".join(st.summary() for st in stage_stats.values())
+            + f"\n{file_cache_summary()}"
+            + f"\n{transfer_timings_summary()}"
         )
 
     except asyncio.CancelledError:
-        status = "cancelled"
+        if (user_id, task_id) in handed_off_batches:
+            # Lease doosre replica ke paas -> wahi batch chala raha hai, history/chat mat chhuo
+            return "handed_off"
+        status = "interrupted" if shutting_down else "cancelled"
+        try:
+            if shutting_down:
+                await bot.send_message(
+                    dest_chat_id,
+                    "Bot restart ho raha hai, batch yahin ruk gaya. Wapas aakar /resume bhejiye. ♻️",
+                )
+            else:
+                await bot.send_message(dest_chat_id, "Batch cancel kar diya gaya. ❌")
+        except Exception:
+            pass
+    except SourceFetchError as e:
+        # Source fetch baar baar fail -> checkpoint ke saath ruko, /resume wahin se
+        status = "interrupted"
         try:
-            await bot.send_message(dest_chat_id, "Batch cancel kar diya gaya. ❌")
+            await bot.send_message(
+                dest_chat_id,
+                "Source se messages fetch nahi ho paaye, batch yahin ruk gaya. "
+                "Thodi der baad /resume bhejiye. ♻️",
+            )
         except Exception:
             pass
+        await log_to_channel(f"[BOT_PUBLIC] Batch source fetch failed for user {user_id}: {e}")
     except Exception as e:
         status = "error"
         try:
@@ -2165,30 +6258,57 @@ async def batch_worker_public(user_id: int, dest_chat_id: int, link: str, count:
             pass
         await log_to_channel(f"[BOT_PUBLIC] Batch error for user {user_id}: {e}")
     finally:
-        await finalize_batch_record(
-            user_id, task_id, status, downloaded_count[0], error_count[0], media_count[0]
-        )
-        batch_tasks.pop(user_id, None)
-        batch_states.pop(user_id, None)
-        shutil.rmtree(temp_dir, ignore_errors=True)
+        if (user_id, task_id) not in handed_off_batches:
+            await close_batch_record(
+                user_id, task_id, status, progress, downloaded_count[0], error_count[0], media_count[0]
+            )
+        temp_storage.remove_batch_dir(temp_dir)
+    return status
 
 
 # ---------- FLASK (Render healthcheck) ----------
-flask_app = Flask(__name__)
-
+def run_flask():
+    # Flask (werkzeug, jinja2) sirf health thread me load, bot startup ke critical path se bahar
+    from flask import Flask
 
-@flask_app.route("/")
-def index():
-    return "SERENA Bot is running. 💖", 200
+    flask_app = Flask(__name__)
 
+    @flask_app.route("/")
+    def index():
+        return "SERENA Bot is running. 💖", 200
 
-def run_flask():
     port = int(os.environ.get("PORT", 10000))
     flask_app.run(host="0.0.0.0", port=port, debug=False, use_reloader=False)
 
 
 # ---------- MAIN ----------
+async def main():
+    swept = temp_storage.sweep_orphans()
+    if swept:
+        print(f"[DEBUG] removed {swept} orphaned temp dirs")
+    if PERSISTENT_SESSIONS:
+        await ensure_pyro_storage_indexes()
+    await bot.start()
+    if worker_shards.enabled:
+        # Uploads/user clients shards me; front sirf commands + scheduler
+        worker_shards.start()
+    else:
+        await uploader_pool.start(UPLOADER_BOT_TOKENS)
+    janitor = asyncio.create_task(user_client_janitor())
+    states_janitor = asyncio.create_task(state_janitor_loop())
+    batch_scheduler.start()
+    await recover_interrupted_batches()
+    await idle()
+    janitor.cancel()
+    states_janitor.cancel()
+    await shutdown_batches()
+    await worker_shards.stop()
+    await user_client_pool.close_all()
+    await uploader_pool.stop()
+    await bot.stop()
+
+
 if __name__ == "__main__":
     threading.Thread(target=run_flask, daemon=True).start()
-    print("Starting SERENA bot...")
-    bot.run()
+    print(f"Starting SERENA bot... (event loop: {type(asyncio.get_event_loop_policy()).__module__})")
+    bot.run(main())